@@ -0,0 +1,214 @@
+import hashlib
+import json
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from recipes.models import Ingredient, RecipeIngredient, Tag
+
+
+CATALOGUE_MAX_AGE = getattr(settings, 'CATALOGUE_MAX_AGE', 5 * 60)
+INGREDIENT_SEARCH_LIMIT = getattr(settings, 'INGREDIENT_SEARCH_LIMIT', 50)
+PANTRY_INDEX_MAX_AGE = getattr(settings, 'PANTRY_INDEX_MAX_AGE', 60 * 60)
+ID_TYPECODE = 'q'
+
+CacheState = namedtuple(
+    'CacheState', ('built_at', 'data', 'etag', 'last_modified'))
+
+
+class ProcessCache:
+    max_age = CATALOGUE_MAX_AGE
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._previous = None
+
+    def build(self):
+        raise NotImplementedError('ProcessCache.build() must be implemented.')
+
+    def get_payload(self, data):
+        return data
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def is_fresh(self, state):
+        return state is not None and (
+            self.max_age is None
+            or time.monotonic() - state.built_at < self.max_age
+        )
+
+    def get_state(self):
+        state = self._state
+        if not self.is_fresh(state):
+            with self._lock:
+                state = self._state
+                if not self.is_fresh(state):
+                    state = self.rebuild(self._previous)
+                    self._state = self._previous = state
+        return state
+
+    def rebuild(self, previous):
+        data = self.build()
+        payload = json.dumps(
+            self.get_payload(data),
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        etag = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        if previous is not None and previous.etag == etag:
+            last_modified = previous.last_modified
+        else:
+            last_modified = timezone.now().replace(microsecond=0)
+        return CacheState(time.monotonic(), data, etag, last_modified)
+
+    @property
+    def data(self):
+        return self.get_state().data
+
+    def etag(self, request, *args, **kwargs):
+        return self.get_state().etag
+
+    def last_modified(self, request, *args, **kwargs):
+        return self.get_state().last_modified
+
+
+class IngredientIndex(ProcessCache):
+    def build(self):
+        items = sorted(
+            (
+                (ingredient['name'].casefold(), ingredient['id']),
+                ingredient
+            )
+            for ingredient in Ingredient.objects.values(
+                'id', 'name', 'measurement_unit')
+        )
+        return (
+            [key[0] for key, _ in items],
+            [ingredient for _, ingredient in items],
+        )
+
+    def get_payload(self, data):
+        return data[1]
+
+    def all(self):
+        return self.data[1]
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        names, ingredients = self.data
+        query = query.casefold()
+        start = bisect_left(names, query)
+        end = start
+        while end < len(names) and names[end].startswith(query):
+            end += 1
+        results = ingredients[start:end]
+        if limit is not None and len(results) >= limit:
+            return results[:limit]
+        for position, name in enumerate(names):
+            if (start <= position < end) or query not in name:
+                continue
+            results.append(ingredients[position])
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+    def etag(self, request, *args, **kwargs):
+        name = request.GET.get('name')
+        etag = self.get_state().etag
+        if name is None:
+            return etag
+        return hashlib.sha1('{}:{}:{}'.format(
+            etag, INGREDIENT_SEARCH_LIMIT, name.casefold()
+        ).encode('utf-8')).hexdigest()
+
+
+class TagCatalogue(ProcessCache):
+    def build(self):
+        tags = list(Tag.objects.values('id', 'name', 'color', 'slug'))
+        return (
+            tags,
+            {tag['id']: tag for tag in tags},
+            {tag['slug']: tag for tag in tags},
+        )
+
+    def get_payload(self, data):
+        return data[0]
+
+    def all(self):
+        return self.data[0]
+
+    @property
+    def by_id(self):
+        return self.data[1]
+
+    @property
+    def by_slug(self):
+        return self.data[2]
+
+
+class PantryIndex(ProcessCache):
+    max_age = PANTRY_INDEX_MAX_AGE
+
+    @staticmethod
+    def get_rows(**filters):
+        return RecipeIngredient.objects.filter(**filters).order_by(
+            'recipe_id', 'ingredient_id'
+        ).values_list('recipe_id', 'ingredient_id')
+
+    def build(self):
+        postings, recipes = {}, {}
+        for recipe_id, ingredient_id in self.get_rows().iterator():
+            recipes.setdefault(
+                recipe_id, array(ID_TYPECODE)).append(ingredient_id)
+            postings.setdefault(
+                ingredient_id, array(ID_TYPECODE)).append(recipe_id)
+        return postings, recipes
+
+    def rebuild(self, previous):
+        return CacheState(time.monotonic(), self.build(), None, None)
+
+    def match(self, ingredient_ids):
+        postings, recipes = self.data
+        with self._lock:
+            matched = Counter()
+            for ingredient_id in set(ingredient_ids):
+                matched.update(postings.get(ingredient_id, ()))
+            ranked = [
+                (len(recipes[recipe_id]) - count, -count, -recipe_id)
+                for recipe_id, count in matched.items()
+            ]
+        ranked.sort()
+        return [
+            (-recipe_id, -count, missing)
+            for missing, count, recipe_id in ranked
+        ]
+
+    def update_recipes(self, recipe_ids):
+        recipe_ids = set(recipe_ids)
+        rows = list(self.get_rows(recipe_id__in=recipe_ids))
+        with self._lock:
+            if self._state is None:
+                return
+            postings, recipes = self._state.data
+            for recipe_id in recipe_ids:
+                for ingredient_id in recipes.pop(recipe_id, ()):
+                    posting = postings[ingredient_id]
+                    del posting[bisect_left(posting, recipe_id)]
+                    if not posting:
+                        del postings[ingredient_id]
+            for recipe_id, ingredient_id in rows:
+                recipes.setdefault(
+                    recipe_id, array(ID_TYPECODE)).append(ingredient_id)
+                insort(postings.setdefault(
+                    ingredient_id, array(ID_TYPECODE)), recipe_id)
+
+
+ingredient_index = IngredientIndex()
+tag_catalogue = TagCatalogue()
+pantry_index = PantryIndex()
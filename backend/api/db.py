@@ -0,0 +1,43 @@
+from django.db import connections, router
+
+
+def get_link_columns(model, field='recipe'):
+    quote = connections[router.db_for_write(model)].ops.quote_name
+    target = model._meta.get_field(field)
+    return (
+        quote(model._meta.db_table),
+        quote(model._meta.get_field('user').column),
+        quote(target.column),
+        quote(target.related_model._meta.db_table),
+        quote(target.target_field.column),
+    )
+
+
+def insert_links(model, user_id, target_ids, field='recipe'):
+    connection = connections[router.db_for_write(model)]
+    ops = connection.ops
+    table, user_column, target_column, targets, pk = get_link_columns(
+        model, field)
+    sql = (
+        '{} {} ({}, {}) SELECT %s, {} FROM {} WHERE {} IN ({}){} '
+        'RETURNING {}'
+    ).format(
+        ops.insert_statement(ignore_conflicts=True), table, user_column,
+        target_column, pk, targets, pk, ', '.join(['%s'] * len(target_ids)),
+        ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+        target_column,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *target_ids])
+        return {target_id for target_id, in cursor.fetchall()}
+
+
+def delete_links(model, user_id, target_ids, field='recipe'):
+    connection = connections[router.db_for_write(model)]
+    table, user_column, target_column, _, _ = get_link_columns(model, field)
+    sql = 'DELETE FROM {} WHERE {} = %s AND {} IN ({}) RETURNING {}'.format(
+        table, user_column, target_column,
+        ', '.join(['%s'] * len(target_ids)), target_column)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *target_ids])
+        return {target_id for target_id, in cursor.fetchall()}
@@ -0,0 +1,94 @@
+import base64
+import binascii
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+
+from recipes.images import MAX_IMAGE_SIZE
+
+
+MAX_UPLOAD_SIZE = getattr(
+    settings, 'RECIPE_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+DECODE_CHUNK_SIZE = 256 * 1024
+BASE64_MARKER = ';base64,'
+IMAGE_FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные изображения в base64.',
+        'too_large': (
+            'Размер файла не должен превышать {max_size} байт.'),
+        'invalid_format': (
+            'Допустимые форматы изображения: JPEG, PNG, GIF, WEBP.'),
+        'too_big': (
+            'Размер изображения не должен превышать '
+            '{max_width}x{max_height} пикселей'),
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            if data.size > MAX_UPLOAD_SIZE:
+                self.fail('too_large', max_size=MAX_UPLOAD_SIZE)
+            data.seek(0)
+            return self.validate_header(data)
+        if not isinstance(data, str) or not data:
+            self.fail('invalid_base64')
+        start = data.find(BASE64_MARKER)
+        start = 0 if start == -1 else start + len(BASE64_MARKER)
+        if (len(data) - start) * 3 // 4 > MAX_UPLOAD_SIZE:
+            self.fail('too_large', max_size=MAX_UPLOAD_SIZE)
+        file = UploadedFile(file=tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+            dir=settings.FILE_UPLOAD_TEMP_DIR,
+        ))
+        try:
+            file.size = self.decode_to(data, start, file)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        return self.validate_header(file)
+
+    @staticmethod
+    def decode_to(data, start, file):
+        size = 0
+        remainder = ''
+        for position in range(start, len(data), DECODE_CHUNK_SIZE):
+            chunk = remainder + ''.join(
+                data[position:position + DECODE_CHUNK_SIZE].split())
+            end = len(chunk) - len(chunk) % 4
+            remainder = chunk[end:]
+            decoded = base64.b64decode(chunk[:end], validate=True)
+            file.write(decoded)
+            size += len(decoded)
+        if remainder:
+            raise ValueError('Incomplete base64 data')
+        return size
+
+    def validate_header(self, file):
+        try:
+            image = Image.open(file)
+        except (UnidentifiedImageError, Image.DecompressionBombError,
+                OSError):
+            self.fail('invalid_format')
+        if image.format not in IMAGE_FORMATS:
+            self.fail('invalid_format')
+        max_width, max_height = MAX_IMAGE_SIZE
+        width, height = image.size
+        if width > max_width or height > max_height:
+            self.fail('too_big', max_width=max_width, max_height=max_height)
+        file.seek(0)
+        file.name = '{}.{}'.format(uuid.uuid4(), IMAGE_FORMATS[image.format])
+        file.content_type = Image.MIME.get(image.format)
+        file.image = image
+        return file
@@ -1,8 +1,10 @@
+from django.db.models import Exists, OuterRef
 from django_filters import FilterSet, filters
+
+from api.catalogue import tag_catalogue
 from recipes.models import (
     Recipe,
     Ingredient,
-    Tag
 )
 
 
@@ -14,6 +16,16 @@ class IngredientFilter(FilterSet):
         fields = ['name']
 
 
+RECIPE_ORDERINGS = {
+    'new': ('-publish_date', '-id'),
+    'popular': ('-favorites_count', '-publish_date', '-id'),
+}
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in tag_catalogue.by_slug]
+
+
 class RecipeFilter(FilterSet):
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited')
@@ -21,16 +33,38 @@ class RecipeFilter(FilterSet):
         method='filter_is_in_shopping_cart')
     author = filters.NumberFilter(
         field_name='author_id')
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    search = filters.CharFilter(method='filter_search')
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='filter_tags',
     )
+    ordering = filters.ChoiceFilter(
+        choices=[(ordering, ordering) for ordering in RECIPE_ORDERINGS],
+        method='filter_ordering')
 
     class Meta:
         model = Recipe
         fields = ['is_favorited', 'is_in_shopping_cart', 'author', 'tags']
 
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        by_slug = tag_catalogue.by_slug
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=[
+                by_slug[slug]['id'] for slug in value if slug in by_slug],
+        )))
+
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.search(value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
     def filter_is_favorited(self, queryset, name, value):
         if value:
             return queryset.filter(favorite__user=self.request.user)
@@ -0,0 +1,233 @@
+import json
+import math
+import platform
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import mean
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+REQUESTS = 200
+WARMUP = 10
+PERCENTILES = (50, 95, 99)
+SAMPLE_SIZE = 1000
+
+
+def percentile(values, rank):
+    return values[max(math.ceil(rank / 100 * len(values)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the API endpoints through the Django test client or a '
+        'running server and print a JSON latency report'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=REQUESTS,
+                            help='Количество запросов к каждому эндпоинту')
+        parser.add_argument('--warmup', type=int, default=WARMUP)
+        parser.add_argument('--endpoints', nargs='+',
+                            help='Проверить только указанные эндпоинты')
+        parser.add_argument('--user',
+                            help='Email пользователя для запросов с токеном')
+        parser.add_argument('--base-url',
+                            help='Адрес запущенного сервера, например '
+                                 'http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Параллельные запросы (только с --base-url)')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--output', help='Файл для JSON-отчета')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['warmup'] < 0:
+            raise CommandError('Некорректное количество запросов')
+        if options['concurrency'] < 1 or (
+            options['concurrency'] > 1 and not options['base_url']
+        ):
+            raise CommandError(
+                '--concurrency больше 1 поддерживается только с --base-url')
+        self.random = random.Random(options['seed'])
+        self.sample = self.get_sample(options['user'])
+        self.base_url = options['base_url']
+        self.client = Client()
+        self.headers = {
+            'Authorization': 'Token {}'.format(Token.objects.get_or_create(
+                user=self.sample['user'])[0].key)
+        }
+        endpoints = self.get_endpoints()
+        selected = options['endpoints'] or list(endpoints)
+        unknown = set(selected) - set(endpoints)
+        if unknown:
+            raise CommandError('Неизвестные эндпоинты: {}'.format(
+                ', '.join(sorted(unknown))))
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'target': self.base_url or 'django.test.Client',
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'rows': {
+                model._meta.db_table: model.objects.count()
+                for model in (User, Recipe, Ingredient, Tag)
+            },
+            'endpoints': {},
+        }
+        for name in selected:
+            if options['verbosity'] > 1:
+                self.stderr.write(name)
+            report['endpoints'][name] = self.run_endpoint(
+                *endpoints[name], options['requests'], options['warmup'],
+                options['concurrency'])
+        payload = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(payload)
+        else:
+            self.stdout.write(payload)
+
+    def get_sample(self, email):
+        users = User.objects.annotate(cart_size=Count('shoppinglist'))
+        if email:
+            user = users.filter(email=email).first()
+        else:
+            user = users.order_by('-cart_size', 'id').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователя для запросов: выполните generate_data')
+        recipe_ids = list(Recipe.objects.order_by('?').values_list(
+            'id', flat=True)[:SAMPLE_SIZE])
+        if not recipe_ids:
+            raise CommandError('Нет рецептов: выполните generate_data')
+        return {
+            'user': user,
+            'recipe_ids': recipe_ids,
+            'author_ids': list(Recipe.objects.filter(
+                id__in=recipe_ids).values_list('author_id', flat=True)),
+            'tag_slugs': list(Tag.objects.values_list('slug', flat=True)),
+            'ingredients': list(Ingredient.objects.order_by('?').values_list(
+                'id', 'name')[:SAMPLE_SIZE]),
+        }
+
+    def get_endpoints(self):
+        pick = self.random.choice
+        sample = self.sample
+        recipes = reverse('recipes-list')
+
+        def query(path, **params):
+            return '{}?{}'.format(path, urlencode(params, doseq=True))
+
+        return {
+            'recipes-list': (False, lambda: query(
+                recipes, page=self.random.randint(1, 10))),
+            'recipes-list-auth': (True, lambda: query(
+                recipes, page=self.random.randint(1, 10))),
+            'recipes-list-tags': (True, lambda: query(
+                recipes, tags=self.random.sample(
+                    sample['tag_slugs'],
+                    min(2, len(sample['tag_slugs']))))),
+            'recipes-list-author': (True, lambda: query(
+                recipes, author=pick(sample['author_ids']))),
+            'recipes-list-favorited': (True, lambda: query(
+                recipes, is_favorited=1)),
+            'recipes-search': (True, lambda: query(
+                recipes, search=pick(sample['ingredients'])[1])),
+            'recipes-detail': (False, lambda: reverse(
+                'recipes-detail', args=[pick(sample['recipe_ids'])])),
+            'recipes-detail-auth': (True, lambda: reverse(
+                'recipes-detail', args=[pick(sample['recipe_ids'])])),
+            'recipes-pantry': (True, lambda: query(
+                reverse('recipes-pantry'), ingredients=[
+                    ingredient_id for ingredient_id, _ in self.random.sample(
+                        sample['ingredients'],
+                        min(10, len(sample['ingredients'])))])),
+            'ingredients-search': (False, lambda: query(
+                reverse('ingredients-list'),
+                name=pick(sample['ingredients'])[1][:2])),
+            'tags-list': (False, lambda: reverse('tags-list')),
+            'users-list': (True, lambda: reverse('users-list')),
+            'users-subscriptions': (True, lambda: query(
+                reverse('users-subscriptions'), recipes_limit=3)),
+            'download-shopping-cart': (True, lambda: reverse(
+                'recipes-download-shopping-cart')),
+        }
+
+    def run_endpoint(self, authenticated, get_path, requests, warmup,
+                     concurrency):
+        headers = self.headers if authenticated else {}
+        for _ in range(warmup):
+            self.request(get_path(), headers)
+        paths = [get_path() for _ in range(requests)]
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(
+                    lambda path: self.request(path, headers), paths))
+        else:
+            results = [self.request(path, headers) for path in paths]
+        elapsed = time.perf_counter() - started
+        latencies = sorted(latency for latency, _, _ in results)
+        statuses = {}
+        for _, status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        queries = [count for _, _, count in results if count is not None]
+        return {
+            'status': statuses,
+            'errors': sum(1 for _, status, _ in results if status >= 400),
+            'latency_ms': {
+                'mean': round(mean(latencies), 2),
+                **{
+                    f'p{rank}': round(percentile(latencies, rank), 2)
+                    for rank in PERCENTILES
+                },
+                'max': round(latencies[-1], 2),
+            },
+            'queries': {
+                'mean': round(mean(queries), 2),
+                'max': max(queries),
+            } if queries else None,
+            'throughput_rps': round(requests / elapsed, 1),
+        }
+
+    def request(self, path, headers):
+        if self.base_url:
+            return self.request_server(path, headers)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(path, **{
+                'HTTP_{}'.format(name.upper()): value
+                for name, value in headers.items()
+            })
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latency = (time.perf_counter() - started) * 1000
+        return latency, response.status_code, len(queries)
+
+    def request_server(self, path, headers):
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(self.base_url.rstrip('/') + path,
+                                 headers=headers)) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        return (time.perf_counter() - started) * 1000, status, None
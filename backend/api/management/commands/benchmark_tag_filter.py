@@ -0,0 +1,146 @@
+import random
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.http import QueryDict
+
+from api.catalogue import tag_catalogue
+from api.filters import RecipeFilter
+from api.paginations import PAGE_SIZE
+from recipes.models import Recipe, Tag
+from users.models import User
+
+
+RECIPE_COUNTS = (1000, 10000, 50000)
+TAG_COUNTS = (1, 2, 4, 8)
+REPEAT = 5
+BATCH_SIZE = 5000
+SLUG_PREFIX = 'benchmark-tag'
+ROW = '{:>8} {:>5} {:>10} {:>10} {:>10} {:>10} {:>8}'
+TIMING = '{:.1f}'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the tag filter with a plain M2M join on throwaway data; '
+        'all generated rows are rolled back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, nargs='+', default=RECIPE_COUNTS,
+            help='Количество рецептов в наборах данных')
+        parser.add_argument(
+            '--tags', type=int, nargs='+', default=TAG_COUNTS,
+            help='Количество выбранных тегов в запросе')
+        parser.add_argument(
+            '--repeat', type=int, default=REPEAT,
+            help='Количество повторов каждого замера')
+
+    def handle(self, *args, **options):
+        tag_counts = options['tags']
+        if min(tag_counts) < 1 or min(options['recipes']) < 1:
+            raise CommandError('Количества должны быть больше 0')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше 0')
+        self.stdout.write(ROW.format(
+            'recipes', 'tags', 'join', 'exists', 'join', 'exists', 'дубли'))
+        self.stdout.write(ROW.format(
+            '', '', 'page, мс', 'page, мс', 'count, мс', 'count, мс', ''))
+        for recipe_count in sorted(options['recipes']):
+            try:
+                with transaction.atomic():
+                    slugs = self.seed(recipe_count, max(tag_counts))
+                    for tag_count in tag_counts:
+                        self.measure(
+                            recipe_count, slugs[:tag_count],
+                            options['repeat'])
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                tag_catalogue.invalidate()
+
+    def seed(self, recipe_count, tag_count):
+        author = User.objects.create(
+            email='benchmark@example.com', username='benchmark')
+        tags = Tag.objects.bulk_create(
+            Tag(
+                name=f'{SLUG_PREFIX}-{index}',
+                color='#{:06X}'.format(0xBE0000 + index),
+                slug=f'{SLUG_PREFIX}-{index}',
+            )
+            for index in range(tag_count)
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {index}',
+                    text='Тестовый рецепт',
+                    cooking_time=1,
+                    image='recipe/images/benchmark.png',
+                )
+                for index in range(recipe_count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        through = Recipe.tags.through
+        random.seed(recipe_count)
+        max_tags = min(3, len(tags))
+        through.objects.bulk_create(
+            (
+                through(recipe_id=recipe_id, tag_id=tag.id)
+                for recipe_id in Recipe.objects.filter(
+                    author=author).values_list('id', flat=True)
+                for tag in random.sample(tags, random.randint(1, max_tags))
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE {}, {}'.format(
+                    Recipe._meta.db_table, through._meta.db_table))
+        tag_catalogue.invalidate()
+        return [tag.slug for tag in tags]
+
+    def measure(self, recipe_count, slugs, repeat):
+        joined = Recipe.objects.filter(tags__slug__in=slugs).distinct()
+        query = QueryDict(mutable=True)
+        query.setlist('tags', slugs)
+        filtered = RecipeFilter(
+            data=query, queryset=Recipe.objects.all()).qs
+        duplicates = (
+            Recipe.objects.filter(tags__slug__in=slugs).count()
+            - filtered.count()
+        )
+        self.stdout.write(ROW.format(
+            recipe_count, len(slugs),
+            TIMING.format(self.time_page(joined, repeat)),
+            TIMING.format(self.time_page(filtered, repeat)),
+            TIMING.format(self.time_count(joined, repeat)),
+            TIMING.format(self.time_count(filtered, repeat)),
+            duplicates))
+
+    @staticmethod
+    def timeit(function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return median(timings) * 1000
+
+    def time_page(self, queryset, repeat):
+        return self.timeit(
+            lambda: list(queryset.values_list('id', flat=True)[:PAGE_SIZE]),
+            repeat)
+
+    def time_count(self, queryset, repeat):
+        return self.timeit(queryset.count, repeat)
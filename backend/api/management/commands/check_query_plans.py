@@ -0,0 +1,153 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.query import RawQuerySet
+from django.http import QueryDict
+
+from api.catalogue import tag_catalogue
+from api.filters import IngredientFilter, RecipeFilter
+from api.paginations import PAGE_SIZE
+from api.shopping_cart import get_shopping_cart_rows
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingList,
+    Tag
+)
+from users.models import Subscription, User
+from users.views import UserViewSet
+
+
+SEQ_SCAN = 'Seq Scan'
+FULL_INDEX_SCAN = 'Full Index Scan'
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the hot API queries on PostgreSQL with sequential scans '
+        'disabled and fail if any of them still needs one'
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                'Проверка планов доступна только для PostgreSQL')
+        failures = []
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                for name, query in self.get_queries(*self.seed()):
+                    plan = self.explain(query)
+                    scans = sorted(self.find_full_scans(plan['Plan']))
+                    if scans:
+                        failures.append(name)
+                        self.stdout.write(self.style.ERROR('{}: {}'.format(
+                            name, ', '.join(
+                                f'{scan} on {relation}'
+                                for scan, relation in scans))))
+                    else:
+                        self.stdout.write(f'{name}: OK')
+                    if options['verbosity'] > 1:
+                        self.stdout.write(self.explain(query, 'TEXT'))
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            tag_catalogue.invalidate()
+        if failures:
+            raise CommandError('Полное сканирование в запросах: {}'.format(
+                ', '.join(failures)))
+        self.stdout.write(self.style.SUCCESS(
+            'Все запросы используют индексы.'))
+
+    def seed(self):
+        user = User.objects.create(
+            email='plans-user@example.com', username='plans-user')
+        author = User.objects.create(
+            email='plans-author@example.com', username='plans-author')
+        tag = Tag.objects.create(
+            name='plans-tag', color='#BE00FF', slug='plans-tag')
+        ingredient = Ingredient.objects.create(
+            name='plans-ingredient', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=author, name='plans-recipe', text='plans',
+            cooking_time=1, image='recipe/images/plans.png')
+        recipe.tags.add(tag)
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=1)
+        Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingList.objects.create(user=user, recipe=recipe)
+        Subscription.objects.create(user=user, author=author)
+        return user, author, recipe, ingredient
+
+    @staticmethod
+    def get_queries(user, author, recipe, ingredient):
+        recipes = Recipe.objects.for_list(user)
+        tags = QueryDict(mutable=True)
+        tags.setlist('tags', list(Tag.objects.values_list('slug', flat=True)))
+        return [
+            ('recipe_list', recipes[:PAGE_SIZE]),
+            ('recipe_detail', recipes.filter(pk=recipe.pk)),
+            ('recipe_list_by_author',
+             recipes.filter(author=author)[:PAGE_SIZE]),
+            ('recipe_list_by_tags', RecipeFilter(
+                data=tags, queryset=recipes).qs[:PAGE_SIZE]),
+            ('recipe_list_favorited',
+             recipes.filter(favorite__user=user)[:PAGE_SIZE]),
+            ('recipe_list_in_shopping_cart',
+             recipes.filter(shoppinglist__user=user)[:PAGE_SIZE]),
+            ('recipe_ingredients_prefetch',
+             RecipeIngredient.objects.filter(
+                 recipe__in=[recipe]).select_related('ingredient')),
+            ('recipe_tags_prefetch',
+             Tag.objects.filter(recipes__in=[recipe]).only('id')),
+            ('favorite_exists', Favorite.objects.filter(
+                user=user, recipe=recipe).values('pk')[:1]),
+            ('shopping_cart_exists', ShoppingList.objects.filter(
+                user=user, recipe=recipe).values('pk')[:1]),
+            ('shopping_cart_ingredients',
+             get_shopping_cart_rows(user)),
+            ('ingredient_prefix_search', IngredientFilter(
+                data={'name': ingredient.name[:3]},
+                queryset=Ingredient.objects.all()).qs),
+            ('subscriptions',
+             UserViewSet.get_subscriptions(user)[:PAGE_SIZE]),
+            ('subscription_exists', Subscription.objects.filter(
+                user=user, author=author).values('pk')[:1]),
+            ('subscriptions_latest_recipes', Recipe.objects.filter(
+                author__in=[author]).latest_per_author(3)),
+        ]
+
+    @staticmethod
+    def explain(query, explain_format='JSON'):
+        if isinstance(query, RawQuerySet):
+            sql, params = query.query.sql, query.query.params
+        else:
+            sql, params = query.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'EXPLAIN (FORMAT {explain_format}) {sql}', params)
+            rows = cursor.fetchall()
+        if explain_format == 'JSON':
+            return rows[0][0][0]
+        return '\n'.join(row[0] for row in rows)
+
+    def find_full_scans(self, plan):
+        scans = set()
+        if plan['Node Type'] == SEQ_SCAN:
+            scans.add((SEQ_SCAN, plan['Relation Name']))
+        elif (
+            plan['Node Type'] in INDEX_SCANS
+            and 'Filter' in plan and 'Index Cond' not in plan
+        ):
+            scans.add((FULL_INDEX_SCAN, plan['Index Name']))
+        for child in plan.get('Plans', ()):
+            scans |= self.find_full_scans(child)
+        return scans
@@ -0,0 +1,261 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.renderers import BaseRenderer
+from rest_framework.serializers import BaseSerializer
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = getattr(settings, 'REQUEST_METRICS_ENABLED', True)
+DURATION_BUCKETS = getattr(
+    settings, 'REQUEST_METRICS_BUCKETS',
+    (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+SIMILAR_QUERIES_THRESHOLD = getattr(
+    settings, 'REQUEST_METRICS_SIMILAR_QUERIES', 5)
+SQL_PREVIEW_LENGTH = 200
+UNRESOLVED_VIEW = 'unresolved'
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0
+        self.db_time = 0
+        self.serializer_time = 0
+        self.serializer_depth = 0
+        self.statements = Counter()
+        self.executions = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.statements[sql] += 1
+            self.executions[sql, repr(params)] += 1
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    @property
+    def queries(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicate_queries(self):
+        return self.queries - len(self.executions)
+
+    @property
+    def most_similar(self):
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+    def server_timing(self):
+        return ', '.join((
+            'total;dur={:.1f}'.format(self.duration * 1000),
+            'db;dur={:.1f};desc="{} queries"'.format(
+                self.db_time * 1000, self.queries),
+            'serializer;dur={:.1f}'.format(self.serializer_time * 1000),
+        ))
+
+
+class ViewHistogram:
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration_sum = 0
+        self.db_time_sum = 0
+        self.serializer_time_sum = 0
+        self.queries_sum = 0
+        self.duplicate_queries_sum = 0
+        self.errors = 0
+
+    def add(self, metrics, status_code):
+        duration = metrics.duration * 1000
+        self.count += 1
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.buckets[index] += 1
+                break
+        self.duration_sum += duration
+        self.db_time_sum += metrics.db_time * 1000
+        self.serializer_time_sum += metrics.serializer_time * 1000
+        self.queries_sum += metrics.queries
+        self.duplicate_queries_sum += metrics.duplicate_queries
+        self.errors += status_code >= 500
+
+    def as_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(DURATION_BUCKETS, self.buckets):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets['+Inf'] = self.count
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'duration_ms_sum': round(self.duration_sum, 3),
+            'db_ms_sum': round(self.db_time_sum, 3),
+            'serializer_ms_sum': round(self.serializer_time_sum, 3),
+            'queries_sum': self.queries_sum,
+            'duplicate_queries_sum': self.duplicate_queries_sum,
+            'duration_ms_buckets': buckets,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self.started_at = time.time()
+
+    def record(self, method, view_name, metrics, status_code):
+        with self._lock:
+            histogram = self._views.get((method, view_name))
+            if histogram is None:
+                histogram = self._views[method, view_name] = ViewHistogram()
+            histogram.add(metrics, status_code)
+
+    def snapshot(self):
+        with self._lock:
+            views = [
+                {'method': method, 'view': view_name, **histogram.as_dict()}
+                for (method, view_name), histogram in sorted(
+                    self._views.items())
+            ]
+        return {
+            'uptime_s': round(time.time() - self.started_at, 1),
+            'buckets_ms': list(DURATION_BUCKETS),
+            'views': views,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self.started_at = time.time()
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        if not METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        metrics.finish()
+        match = request.resolver_match
+        view_name = match.view_name if match else UNRESOLVED_VIEW
+        registry.record(
+            request.method, view_name, metrics, response.status_code)
+        response['Server-Timing'] = metrics.server_timing()
+        self.log(request, view_name, metrics, response.status_code)
+        return response
+
+    @staticmethod
+    def log(request, view_name, metrics, status_code):
+        sql, repeats = metrics.most_similar
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': status_code,
+            'duration_ms': round(metrics.duration * 1000, 2),
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'serializer_ms': round(metrics.serializer_time * 1000, 2),
+            'queries': metrics.queries,
+            'duplicate_queries': metrics.duplicate_queries,
+        }
+        level = logging.INFO
+        if repeats >= SIMILAR_QUERIES_THRESHOLD:
+            level = logging.WARNING
+            record['similar_queries'] = repeats
+            record['similar_sql'] = sql[:SQL_PREVIEW_LENGTH]
+        logger.log(level, json.dumps(record, ensure_ascii=False))
+
+
+def timed_serializer_data(data):
+    def wrapper(serializer):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializer_depth:
+            return data.fget(serializer)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_depth -= 1
+    return property(wrapper)
+
+
+def install_serializer_timing():
+    if METRICS_ENABLED and not getattr(
+            BaseSerializer.data, 'metrics_timed', False):
+        BaseSerializer.data = timed_serializer_data(BaseSerializer.data)
+        BaseSerializer.data.fget.metrics_timed = True
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+    prefix = 'foodgram_request'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if 'views' not in data:
+            return json.dumps(data, ensure_ascii=False).encode(self.charset)
+        lines = [
+            f'# TYPE {self.prefix}_duration_milliseconds histogram',
+        ]
+        for view in data['views']:
+            labels = 'method="{}",view="{}"'.format(
+                view['method'], view['view'])
+            for bound, count in view['duration_ms_buckets'].items():
+                lines.append(
+                    f'{self.prefix}_duration_milliseconds_bucket'
+                    f'{{{labels},le="{bound}"}} {count}')
+            lines.append(
+                f'{self.prefix}_duration_milliseconds_sum{{{labels}}} '
+                f'{view["duration_ms_sum"]}')
+            lines.append(
+                f'{self.prefix}_duration_milliseconds_count{{{labels}}} '
+                f'{view["count"]}')
+        for name, key in (
+            ('db_milliseconds_total', 'db_ms_sum'),
+            ('serializer_milliseconds_total', 'serializer_ms_sum'),
+            ('queries_total', 'queries_sum'),
+            ('duplicate_queries_total', 'duplicate_queries_sum'),
+            ('errors_total', 'errors'),
+        ):
+            lines.append(f'# TYPE {self.prefix}_{name} counter')
+            for view in data['views']:
+                lines.append(
+                    '{}_{}{{method="{}",view="{}"}} {}'.format(
+                        self.prefix, name, view['method'], view['view'],
+                        view[key]))
+        return ('\n'.join(lines) + '\n').encode(self.charset)
@@ -1,11 +1,53 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 PAGE_SIZE = 6
 MAX_PAGE_SIZE = 100
 
 
-class Paginator(PageNumberPagination):
+class CursorPaginator(CursorPagination):
     page_size = PAGE_SIZE
     page_size_query_param = 'limit'
     max_page_size = MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        return view.cursor_ordering
+
+
+class PageNumberPaginator(PageNumberPagination):
+    page_size = PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class Paginator(PageNumberPaginator):
+    cursor_paginator_class = CursorPaginator
+    cursor_paginator = None
+
+    # CursorPagination keys the cursor on the first ordering field only and
+    # steps over ties with an offset, so orderings whose first field has
+    # many equal values (e.g. favorites_count) skip or repeat rows between
+    # pages. Cursor mode is therefore limited to the view's cursor_ordering,
+    # whose first field is nearly unique; any other ordering falls back to
+    # page numbers.
+    @staticmethod
+    def supports_cursor(queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        return bool(ordering) and tuple(
+            queryset.query.order_by or ordering) == tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            self.cursor_paginator_class.cursor_query_param
+            in request.query_params
+            and self.supports_cursor(queryset, view)
+        ):
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import uuid
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Favorite, ShoppingList
+from users.models import Subscription
+
+
+CACHE_ALIAS = 'recipes'
+LIST_PARAMS = (
+    'tags', 'author', 'search', 'page', 'limit', 'ordering', 'cursor')
+GENERATION_KEY = 'recipes:generation'
+LIST_VERSION_KEY = 'recipes:list-version'
+RECIPE_VERSION_KEY = 'recipes:version:{}'
+
+
+class RecipeResponseCache:
+    def __init__(self, alias=CACHE_ALIAS):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_versions(self, *keys):
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                self.cache.add(key, uuid.uuid4().hex, None)
+                versions[key] = self.cache.get(key)
+        return [versions[key] for key in keys]
+
+    def bump(self, *keys):
+        self.cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    @staticmethod
+    def is_cacheable(request):
+        return (
+            request.method == 'GET'
+            and set(request.query_params) <= set(LIST_PARAMS)
+        )
+
+    @staticmethod
+    def get_query(request):
+        params = request.query_params
+        return urlencode([
+            (name, value)
+            for name in LIST_PARAMS
+            for value in sorted(set(params.getlist(name)))
+        ])
+
+    def get_list_key(self, request):
+        if not self.is_cacheable(request):
+            return None
+        generation, version = self.get_versions(
+            GENERATION_KEY, LIST_VERSION_KEY)
+        query = hashlib.sha1('{}?{}'.format(
+            request.build_absolute_uri('/'), self.get_query(request)
+        ).encode('utf-8')).hexdigest()
+        return f'recipes:list:{generation}:{version}:{query}'
+
+    def get_detail_key(self, request, pk):
+        if not self.is_cacheable(request) or request.query_params:
+            return None
+        generation, version = self.get_versions(
+            GENERATION_KEY, RECIPE_VERSION_KEY.format(pk))
+        host = hashlib.sha1(
+            request.build_absolute_uri('/').encode('utf-8')).hexdigest()
+        return f'recipes:detail:{generation}:{version}:{pk}:{host}'
+
+    def serve(self, key, view, request, *args, **kwargs):
+        if key is None:
+            return view(request, *args, **kwargs)
+        content = self.cache.get(key)
+        if content is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = JSONRenderer().render(response.data)
+            self.cache.set(key, content)
+        if request.user.is_authenticated:
+            content = JSONRenderer().render(
+                self.personalize(json.loads(content), request.user))
+        return HttpResponse(content, content_type=JSONRenderer.media_type)
+
+    @staticmethod
+    def get_user_flags(user, recipe_ids, author_ids):
+        return (
+            set(Favorite.objects.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True)),
+            set(ShoppingList.objects.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True)),
+            set(Subscription.objects.filter(
+                user=user, author_id__in=author_ids
+            ).values_list('author_id', flat=True)),
+        )
+
+    def personalize(self, data, user):
+        recipes = data['results'] if 'results' in data else [data]
+        if not recipes:
+            return data
+        favorited, in_cart, subscribed = self.get_user_flags(
+            user,
+            {recipe['id'] for recipe in recipes},
+            {recipe['author']['id'] for recipe in recipes},
+        )
+        for recipe in recipes:
+            recipe['is_favorited'] = recipe['id'] in favorited
+            recipe['is_in_shopping_cart'] = recipe['id'] in in_cart
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in subscribed)
+        return data
+
+    def invalidate_recipes(self, recipe_ids):
+        self.bump(LIST_VERSION_KEY, *(
+            RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids))
+
+    def invalidate_all(self):
+        self.bump(GENERATION_KEY)
+
+
+recipe_response_cache = RecipeResponseCache()
@@ -1,20 +1,40 @@
 import re
 
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.validators import UniqueValidator
 from drf_extra_fields.fields import Base64ImageField
 from djoser.serializers import UserSerializer, UserCreateSerializer
 
+from api.catalogue import tag_catalogue
+from api.fields import StreamingBase64ImageField
+from recipes.images import reset_variants, schedule_variants
 from recipes.models import (
     Ingredient,
     Tag,
     Recipe,
+    ShoppingCartIngredient,
     ShoppingList,
     Favorite,
     RecipeIngredient,
 )
-from users.models import User
+from users.models import User, Subscription
+
+
+MAX_PANTRY_INGREDIENTS = 100
+MAX_BATCH_RECIPES = 100
+
+
+def get_subscribed_ids(context):
+    if 'subscribed_ids' not in context:
+        request = context.get('request')
+        user = getattr(request, 'user', None)
+        context['subscribed_ids'] = frozenset(
+            Subscription.objects.filter(user=user).values_list(
+                'author_id', flat=True)
+        ) if user is not None and user.is_authenticated else frozenset()
+    return context['subscribed_ids']
 
 
 class UserSerializer(UserSerializer):
@@ -26,12 +46,11 @@ class UserSerializer(UserSerializer):
                   'first_name', 'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request_user = self.context['request'].user
-        return (
-            request_user.is_authenticated
-            and obj != request_user
-            and request_user.subscribers.filter(id=obj.id).exists()
-        )
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        if obj == self.context['request'].user:
+            return False
+        return obj.id in get_subscribed_ids(self.context)
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -72,6 +91,19 @@ class TagSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class CachedTagsField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, tags):
+        by_id = tag_catalogue.by_id
+        return [
+            by_id.get(tag.id) or TagSerializer(tag).data
+            for tag in tags.all()
+        ]
+
+
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
@@ -85,19 +117,40 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 class RecipeListSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
-    tags = TagSerializer(many=True, read_only=True)
+    tags = CachedTagsField()
     author = UserSerializer(
         read_only=True, default=serializers.CurrentUserDefault())
     ingredients = RecipeIngredientSerializer(
         many=True, read_only=True, source='recipe_ingredients')
+    image_variants = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time', 'publish_date')
+
+    def get_image_variants(self, obj):
+        storage = obj.image.storage
+        request = self.context.get('request')
+        return {
+            variant: (
+                request.build_absolute_uri(storage.url(name)) if request
+                else storage.url(name)
+            )
+            for variant, name in obj.image_variants.items()
+        }
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_authenticated:
             return Favorite.objects.filter(
@@ -105,6 +158,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_authenticated:
             return ShoppingList.objects.filter(
@@ -112,6 +167,31 @@ class RecipeListSerializer(serializers.ModelSerializer):
         return False
 
 
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_PANTRY_INGREDIENTS,
+    )
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_RECIPES,
+    )
+
+
+class PantryRecipeSerializer(RecipeListSerializer):
+    matched_ingredients = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeListSerializer.Meta):
+        fields = RecipeListSerializer.Meta.fields + (
+            'matched_ingredients', 'missing_ingredients')
+
+
 class QuantitySerializer(serializers.ModelSerializer):
     amount = serializers.IntegerField()
     id = serializers.IntegerField()
@@ -125,7 +205,7 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
         many=True, queryset=Tag.objects.all())
     ingredients = QuantitySerializer(many=True)
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
 
     class Meta:
         model = Recipe
@@ -147,24 +227,20 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         if not ingredients:
             raise ValidationError(
                 {'ingredients': 'Должен быть хотя бы 1 ингредиент'})
-        ingredients_list = []
-        for item in ingredients:
-            ingredient_id = item['id']
-            try:
-                ingredient = Ingredient.objects.get(id=ingredient_id)
-            except Ingredient.DoesNotExist:
-                raise ValidationError(
-                    {'ingredients':
-                     f'Ингредиент с id {ingredient_id} не найден'})
-            if ingredient in ingredients_list:
-                raise ValidationError(
-                    {'ingredients': 'Ингредиенты должны быть уникальными'})
-            if int(item['amount']) <= 0:
-                raise ValidationError({'amount': 'Количество должно быть > 0'})
-            ingredients_list.append(ingredient)
-        if not ingredients_list:
+        ingredient_ids = {item['id'] for item in ingredients}
+        if len(ingredient_ids) != len(ingredients):
+            raise ValidationError(
+                {'ingredients': 'Ингредиенты должны быть уникальными'})
+        if any(int(item['amount']) <= 0 for item in ingredients):
+            raise ValidationError({'amount': 'Количество должно быть > 0'})
+        missing_ids = ingredient_ids - set(
+            Ingredient.objects.filter(
+                id__in=ingredient_ids).values_list('id', flat=True)
+        )
+        if missing_ids:
             raise ValidationError(
-                {'ingredients': 'Не удалось найти ингредиенты'})
+                {'ingredients': 'Ингредиенты с id {} не найдены'.format(
+                    ', '.join(map(str, sorted(missing_ids))))})
         return ingredients
 
     def validate_tags(self, tags):
@@ -183,36 +259,95 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                 "Поле 'image' не может быть пустым")
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
         self.add_tags(tags, recipe)
         self.add_ingredients(ingredients, recipe)
+        schedule_variants(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if 'tags' in validated_data:
             instance.tags.set(validated_data.pop('tags'))
         if 'ingredients' in validated_data:
-            instance.recipe_ingredients.all().delete()
-            self.add_ingredients(validated_data.pop('ingredients'), instance)
-        return super().update(instance, validated_data)
+            self.update_ingredients(
+                validated_data.pop('ingredients'), instance)
+        image_changed = 'image' in validated_data
+        if image_changed:
+            reset_variants(instance)
+        instance = super().update(instance, validated_data)
+        if image_changed:
+            schedule_variants(instance)
+        return instance
 
     def add_tags(self, tags, recipe):
         recipe.tags.set(tags)
 
     def add_ingredients(self, ingredients, recipe):
-        for item in ingredients:
-            ingredient = item['id']
-            amount = item['amount']
-            RecipeIngredient.objects.create(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
-                ingredient_id=ingredient,
-                amount=amount
+                ingredient_id=item['id'],
+                amount=item['amount']
             )
+            for item in ingredients
+        )
+
+    def update_ingredients(self, ingredients, recipe):
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        changed, removed_ids = [], []
+        for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=recipe):
+            amount = amounts.pop(recipe_ingredient.ingredient_id, None)
+            if amount is None:
+                removed_ids.append(recipe_ingredient.id)
+            elif amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if not (removed_ids or changed or amounts):
+            return
+        user_ids = list(ShoppingList.objects.filter(
+            recipe=recipe).values_list('user_id', flat=True))
+        carts = ShoppingCartIngredient.objects
+        carts.remove_recipes([recipe.id], user_ids)
+        if removed_ids:
+            RecipeIngredient.objects.filter(id__in=removed_ids).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if amounts:
+            self.add_ingredients(
+                [{'id': ingredient_id, 'amount': amount}
+                 for ingredient_id, amount in amounts.items()],
+                recipe
+            )
+        carts.add_recipes([recipe.id], user_ids)
+
+    def to_representation(self, instance):
+        instance = Recipe.objects.for_list(
+            self.context['request'].user).get(pk=instance.pk)
+        return RecipeListSerializer(instance, context=self.context).data
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    image = StreamingBase64ImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+    def update(self, instance, validated_data):
+        reset_variants(instance)
+        instance = super().update(instance, validated_data)
+        schedule_variants(instance)
+        return instance
 
     def to_representation(self, instance):
+        instance = Recipe.objects.for_list(
+            self.context['request'].user).get(pk=instance.pk)
         return RecipeListSerializer(instance, context=self.context).data
 
 
@@ -227,10 +362,21 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 class DownloadShoppingCartSerializer(serializers.Serializer):
-    ingredient_name = serializers.CharField(source='ingredient__name')
-    total_amount = serializers.IntegerField()
+    ingredient_name = serializers.CharField()
+    total_amount = serializers.ReadOnlyField()
+    measurement_unit = serializers.CharField()
+
+
+class ShoppingCartIngredientSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
     measurement_unit = serializers.CharField(
-        source='ingredient__measurement_unit')
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = ShoppingCartIngredient
+        fields = ('id', 'name', 'measurement_unit', 'total_amount',
+                  'recipe_count')
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -244,55 +390,28 @@ class SubscriptionSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            subscribed = obj.subscribers.filter(user=request.user).exists()
-            return subscribed
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in get_subscribed_ids(self.context)
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = (
-            obj.recipes.all()[:int(limit)] if limit else obj.recipes.all()
-        )
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = (
+                obj.recipes.all()[:int(limit)] if limit
+                else obj.recipes.all()
+            )
         serializer = RecipeSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
 
-class SubscriptionActionSerializer(serializers.ModelSerializer):
-    email = serializers.ReadOnlyField()
-    username = serializers.ReadOnlyField()
-    is_subscribed = serializers.SerializerMethodField()
-    recipes = RecipeSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField()
-
-    class Meta:
-        model = User
-        fields = ('email', 'id', 'username', 'first_name', 'last_name',
-                  'is_subscribed', 'recipes', 'recipes_count')
-
-    def validate(self, obj):
-        request = self.context.get('request')
-        if request and (request.user == obj):
-            raise serializers.ValidationError(
-                {'errors': 'Вы не можете подписаться на себя.'})
-        return obj
-
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and obj.subscribers.filter(user=request.user).exists()
-        )
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
-
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
     name = serializers.ReadOnlyField()
     image = Base64ImageField(read_only=True)
@@ -0,0 +1,179 @@
+import csv
+import hashlib
+import json
+from functools import lru_cache
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from recipes.models import ShoppingCartIngredient
+from recipes.units import unit_registry
+
+
+FONT_NAME = 'FreeSans'
+FONT_PATH = settings.BASE_DIR / 'FreeSans.ttf'
+TITLE = 'Список покупок:'
+TITLE_FONT_SIZE = 14
+FONT_SIZE = 12
+LINE_HEIGHT = 15
+MARGIN = 50
+CHUNK_SIZE = 8192
+CACHE_TIMEOUT = getattr(settings, 'SHOPPING_CART_CACHE_TIMEOUT', 60 * 60)
+FILENAME = 'shopping_cart'
+LINE_TEMPLATE = '{ingredient_name} - {total_amount} {measurement_unit}'
+CSV_HEADER = ('ingredient_name', 'total_amount', 'measurement_unit')
+
+EXPORTERS = {}
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+    return FONT_NAME
+
+
+def get_shopping_cart_rows(user):
+    return ShoppingCartIngredient.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'total_amount'
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def get_shopping_cart_ingredients(user):
+    rows = get_shopping_cart_rows(user)
+    return [
+        {
+            'ingredient_name': name,
+            'total_amount': amount,
+            'measurement_unit': measurement_unit,
+        }
+        for name, measurement_unit, amount in unit_registry.consolidate(rows)
+    ]
+
+
+def get_cart_version(ingredients):
+    payload = json.dumps(ingredients, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def iter_chunks(document):
+    for start in range(0, len(document), CHUNK_SIZE):
+        yield document[start:start + CHUNK_SIZE]
+
+
+def register(exporter_class):
+    EXPORTERS[exporter_class.format] = exporter_class
+    return exporter_class
+
+
+def get_exporter_classes():
+    return list(EXPORTERS.values())
+
+
+class ShoppingCartExporter(BaseRenderer):
+    charset = 'utf-8'
+
+    @property
+    def content_type(self):
+        if self.charset:
+            return '{}; charset={}'.format(self.media_type, self.charset)
+        return self.media_type
+
+    @property
+    def filename(self):
+        return '{}.{}'.format(FILENAME, self.format)
+
+    def stream(self, ingredients, user):
+        raise NotImplementedError(
+            'ShoppingCartExporter.stream() must be implemented.')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None and response.exception:
+            response['Content-Type'] = JSONRenderer.media_type
+            return JSONRenderer().render(data)
+        return b''.join(self.stream(data, None))
+
+
+@register
+class PDFExporter(ShoppingCartExporter):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def stream(self, ingredients, user):
+        key = 'shopping_cart:pdf:{}:{}'.format(
+            getattr(user, 'id', None), get_cart_version(ingredients))
+        document = cache.get(key)
+        if document is None:
+            document = self.render_document(ingredients)
+            cache.set(key, document, CACHE_TIMEOUT)
+        return iter_chunks(document)
+
+    def render_document(self, ingredients):
+        font = register_font()
+        buffer = BytesIO()
+        width, height = A4
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        pdf.setFont(font, TITLE_FONT_SIZE)
+        pdf.drawString(MARGIN, height - MARGIN, TITLE)
+        y = height - MARGIN - 2 * LINE_HEIGHT
+        pdf.setFont(font, FONT_SIZE)
+        for ingredient in ingredients:
+            if y < MARGIN:
+                pdf.showPage()
+                pdf.setFont(font, FONT_SIZE)
+                y = height - MARGIN
+            pdf.drawString(MARGIN, y, LINE_TEMPLATE.format(**ingredient))
+            y -= LINE_HEIGHT
+        pdf.showPage()
+        pdf.save()
+        return buffer.getvalue()
+
+
+@register
+class TextExporter(ShoppingCartExporter):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients, user):
+        yield '{}\n'.format(TITLE).encode(self.charset)
+        for ingredient in ingredients:
+            yield '{}\n'.format(
+                LINE_TEMPLATE.format(**ingredient)).encode(self.charset)
+
+
+@register
+class CSVExporter(ShoppingCartExporter):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients, user):
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_HEADER)
+        for ingredient in ingredients:
+            writer.writerow([ingredient[field] for field in CSV_HEADER])
+            yield buffer.getvalue().encode(self.charset)
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode(self.charset)
+
+
+@register
+class JSONExporter(ShoppingCartExporter):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients, user):
+        separator = '['
+        for ingredient in ingredients:
+            yield '{}{}'.format(separator, json.dumps(
+                ingredient, ensure_ascii=False)).encode(self.charset)
+            separator = ','
+        yield ('[]' if separator == '[' else ']').encode(self.charset)
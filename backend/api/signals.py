@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete)
+from django.dispatch import receiver
+
+from api.catalogue import ingredient_index, pantry_index, tag_catalogue
+from api.response_cache import recipe_response_cache
+from recipes.models import (
+    Ingredient, Recipe, RecipeIngredient, ShoppingCartIngredient, ShoppingList,
+    Tag)
+from recipes.signals import recipe_changed
+from users.models import User
+
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+SEARCH_FIELDS = {'name', 'text'}
+
+
+def invalidate_recipes(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(
+        lambda: recipe_response_cache.invalidate_recipes(recipe_ids))
+
+
+def update_search_vector(recipes):
+    if recipes.supports_search_vector():
+        transaction.on_commit(recipes.update_search_vector)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes(instance, update_fields, **kwargs):
+    if update_fields is None or 'name' in update_fields:
+        update_search_vector(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tag_catalogue(**kwargs):
+    transaction.on_commit(tag_catalogue.invalidate)
+    transaction.on_commit(recipe_response_cache.invalidate_all)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+def update_pantry_index(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: pantry_index.update_recipes(recipe_ids))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def update_recipe_pantry(instance, **kwargs):
+    update_pantry_index([instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_carts(instance, **kwargs):
+    ShoppingCartIngredient.objects.remove_recipes(
+        [instance.pk], list(ShoppingList.objects.filter(
+            recipe=instance).values_list('user_id', flat=True)))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(instance, update_fields, **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        update_search_vector(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def invalidate_recipe_ingredient(instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+    update_pantry_index([instance.recipe_id])
+    update_search_vector(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes([instance.pk])
+    elif pk_set:
+        invalidate_recipes(pk_set)
+    else:
+        transaction.on_commit(recipe_response_cache.invalidate_all)
+
+
+@receiver(recipe_changed)
+def invalidate_changed_recipes(recipe_ids, **kwargs):
+    invalidate_recipes(recipe_ids)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(instance, created, update_fields, **kwargs):
+    if created or (
+        update_fields is not None and not AUTHOR_FIELDS & set(update_fields)
+    ):
+        return
+    invalidate_recipes(instance.recipes.values_list('id', flat=True))
@@ -0,0 +1,344 @@
+import threading
+from collections import Counter
+from unittest import mock, skipUnless
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.catalogue import ingredient_index, pantry_index, tag_catalogue
+from api.management.commands.check_query_plans import Command as QueryPlans
+from api.response_cache import CACHE_ALIAS
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCartIngredient,
+    ShoppingList,
+    Tag
+)
+from users.models import Subscription, User
+
+
+RECIPES = 25
+PAGE_SIZES = (1, 6, RECIPES)
+LIST_QUERIES = {'anonymous': 4, 'authenticated': 7}
+DETAIL_QUERIES = {'anonymous': 3, 'authenticated': 6}
+THREADS = 8
+ROUNDS = 5
+AMOUNT = 100
+
+
+class RecipeQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = [
+            User.objects.create_user(
+                email=f'user{index}@example.com', username=f'user{index}',
+                password='Qwerty123')
+            for index in range(4)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {index}', color=f'#00000{index}',
+                slug=f'tag{index}')
+            for index in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(5)
+        ]
+        for index in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=cls.authors[index % len(cls.authors)],
+                name=f'Рецепт {index}', text='Описание', cooking_time=10,
+                image='recipe/images/test.png')
+            recipe.tags.set(tags[:1 + index % len(tags)])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1)
+                for ingredient in ingredients[index % 3:index % 3 + 3]
+            )
+            if index % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if index % 3 == 0:
+                ShoppingList.objects.create(user=cls.user, recipe=recipe)
+        Subscription.objects.create(user=cls.user, author=cls.authors[0])
+        Recipe.objects.recount()
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        for cache in (tag_catalogue, ingredient_index, pantry_index):
+            cache.invalidate()
+        tag_catalogue.data
+        authenticated = APIClient()
+        authenticated.force_authenticate(self.user)
+        self.clients = {
+            'anonymous': APIClient(),
+            'authenticated': authenticated,
+        }
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        for name, client in self.clients.items():
+            for limit in PAGE_SIZES:
+                caches[CACHE_ALIAS].clear()
+                with self.subTest(user=name, limit=limit):
+                    with self.assertNumQueries(LIST_QUERIES[name]):
+                        response = client.get(
+                            reverse('recipes-list'), {'limit': limit})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.json()['results']), limit)
+
+    def test_detail_query_count(self):
+        for name, client in self.clients.items():
+            for recipe in Recipe.objects.order_by('id')[:3]:
+                caches[CACHE_ALIAS].clear()
+                with self.subTest(user=name, recipe=recipe.id):
+                    with self.assertNumQueries(DETAIL_QUERIES[name]):
+                        response = client.get(
+                            reverse('recipes-detail', args=[recipe.id]))
+                    self.assertEqual(response.status_code, 200)
+
+    def test_list_flags_match_user_lists(self):
+        favorited = set(Favorite.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True))
+        in_cart = set(ShoppingList.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True))
+        for name, client in self.clients.items():
+            results = client.get(
+                reverse('recipes-list'), {'limit': RECIPES}).json()['results']
+            authenticated = name == 'authenticated'
+            for recipe in results:
+                with self.subTest(user=name, recipe=recipe['id']):
+                    self.assertEqual(
+                        recipe['is_favorited'],
+                        authenticated and recipe['id'] in favorited)
+                    self.assertEqual(
+                        recipe['is_in_shopping_cart'],
+                        authenticated and recipe['id'] in in_cart)
+                    self.assertEqual(
+                        recipe['author']['is_subscribed'],
+                        authenticated
+                        and recipe['author']['id'] == self.authors[0].id)
+                    self.assertEqual(len(recipe['ingredients']), 3)
+
+    def test_cursor_pages_cover_all_recipes_once(self):
+        client = self.clients['anonymous']
+        seen = []
+        url = reverse('recipes-list') + '?cursor=&limit=4'
+        while url:
+            page = client.get(url).json()
+            self.assertNotIn('count', page)
+            seen += [recipe['id'] for recipe in page['results']]
+            url = page['next']
+        self.assertEqual(
+            seen,
+            list(Recipe.objects.order_by(
+                '-publish_date', '-id').values_list('id', flat=True)))
+
+    def test_cursor_falls_back_to_pages_for_other_orderings(self):
+        response = self.clients['anonymous'].get(
+            reverse('recipes-list'), {'cursor': '', 'ordering': 'popular'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], RECIPES)
+
+
+class ListToggleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = [
+            User.objects.create_user(
+                email=f'toggle{index}@example.com',
+                username=f'toggle{index}', password='Qwerty123')
+            for index in range(2)
+        ]
+        cls.tag = Tag.objects.create(
+            name='Тег', color='#000000', slug='tag')
+        cls.ingredient = Ingredient.objects.create(
+            name='ингредиент', measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipe/images/test.png')
+        cls.recipe.tags.add(cls.tag)
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=10)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_add_to_list(self):
+        for name, model, counter in (
+            ('recipes-favorite', Favorite, 'favorites_count'),
+            ('recipes-shopping-cart', ShoppingList, 'shopping_cart_count'),
+        ):
+            url = reverse(name, args=[self.recipe.id])
+            with self.subTest(model=model.__name__):
+                self.assertEqual(self.client.post(url).status_code, 201)
+                self.assertEqual(self.client.post(url).status_code, 400)
+                self.assertEqual(model.objects.count(), 1)
+                self.recipe.refresh_from_db()
+                self.assertEqual(getattr(self.recipe, counter), 1)
+        self.assertEqual(ShoppingCartIngredient.objects.get(
+            user=self.user).total_amount, 10)
+
+    def test_add_missing_recipe_to_list(self):
+        for name, model in (
+            ('recipes-favorite', Favorite),
+            ('recipes-shopping-cart', ShoppingList),
+        ):
+            for pk in ('99999', 'abc'):
+                with self.subTest(model=model.__name__, pk=pk):
+                    response = self.client.post(reverse(name, args=[pk]))
+                    self.assertEqual(response.status_code, 404)
+                    self.assertFalse(model.objects.exists())
+
+    def test_edit_without_image_keeps_variants(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        with mock.patch('api.serializers.schedule_variants') as schedule:
+            response = client.patch(
+                reverse('recipes-detail', args=[self.recipe.id]),
+                {'text': 'Новое описание', 'tags': [self.tag.id],
+                 'ingredients': [{'id': self.ingredient.id, 'amount': 5}]},
+                format='json')
+        self.assertEqual(response.status_code, 200)
+        schedule.assert_not_called()
+
+    def test_subscribe(self):
+        url = reverse('users-subscribe', args=[self.author.id])
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(Subscription.objects.count(), 1)
+
+    def test_subscribe_to_missing_author(self):
+        for pk in ('99999', 'abc'):
+            with self.subTest(pk=pk):
+                response = self.client.post(
+                    reverse('users-subscribe', args=[pk]))
+                self.assertEqual(response.status_code, 404)
+        self.assertFalse(Subscription.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Нужен PostgreSQL')
+class ConcurrentToggleTests(TransactionTestCase):
+    def setUp(self):
+        self.user, self.author = [
+            User.objects.create_user(
+                email=f'stress{index}@example.com',
+                username=f'stress{index}', password='Qwerty123')
+            for index in range(2)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='ингредиент', measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipe/images/test.png')
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=ingredient, amount=AMOUNT)
+
+    def toggle(self, method, path, data=None):
+        barrier = threading.Barrier(THREADS)
+        results = Counter()
+        lock = threading.Lock()
+
+        def worker():
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                response = getattr(client, method)(path, data, format='json')
+                status = response.status_code
+                if data is not None and status == 200:
+                    status = response.json()['results'][0]['status']
+                with lock:
+                    results[status] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(THREADS)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results
+
+    def assert_toggles(self, path, data, accepted, rejected, count_rows,
+                       check=None):
+        for _ in range(ROUNDS):
+            for method, rows in (('post', 1), ('delete', 0)):
+                with self.subTest(method=method):
+                    self.assertEqual(
+                        self.toggle(method, path, data),
+                        Counter({
+                            accepted[method]: 1,
+                            rejected[method]: THREADS - 1,
+                        }))
+                    self.assertEqual(count_rows(), rows)
+                    if check is not None:
+                        check(rows)
+
+    def assert_recipe_list(self, model, path, batch=False):
+        def check(rows):
+            self.recipe.refresh_from_db()
+            self.assertEqual(getattr(self.recipe, model.counter_field), rows)
+            if model is ShoppingList:
+                self.assertEqual(
+                    list(ShoppingCartIngredient.objects.filter(
+                        user=self.user).values_list(
+                            'total_amount', 'recipe_count')),
+                    [(AMOUNT, 1)] if rows else [])
+
+        self.assert_toggles(
+            path, {'recipes': [self.recipe.id]} if batch else None,
+            {'post': 'added', 'delete': 'removed'} if batch
+            else {'post': 201, 'delete': 204},
+            {'post': 'already_added', 'delete': 'not_in_list'} if batch
+            else {'post': 400, 'delete': 400},
+            model.objects.filter(user=self.user, recipe=self.recipe).count,
+            check)
+
+    def test_favorite(self):
+        self.assert_recipe_list(
+            Favorite, reverse('recipes-favorite', args=[self.recipe.id]))
+
+    def test_shopping_cart(self):
+        self.assert_recipe_list(
+            ShoppingList,
+            reverse('recipes-shopping-cart', args=[self.recipe.id]))
+
+    def test_favorite_batch(self):
+        self.assert_recipe_list(
+            Favorite, reverse('recipes-favorite-batch'), batch=True)
+
+    def test_shopping_cart_batch(self):
+        self.assert_recipe_list(
+            ShoppingList, reverse('recipes-shopping-cart-batch'), batch=True)
+
+    def test_subscribe(self):
+        self.assert_toggles(
+            reverse('users-subscribe', args=[self.author.id]), None,
+            {'post': 201, 'delete': 204}, {'post': 400, 'delete': 400},
+            Subscription.objects.filter(
+                user=self.user, author=self.author).count)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Нужен PostgreSQL')
+class QueryPlanTests(TestCase):
+    def tearDown(self):
+        tag_catalogue.invalidate()
+
+    def test_hot_queries_use_indexes(self):
+        plans = QueryPlans()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, query in plans.get_queries(*plans.seed()):
+            with self.subTest(query=name):
+                self.assertEqual(
+                    sorted(plans.find_full_scans(
+                        plans.explain(query)['Plan'])),
+                    [], plans.explain(query, 'TEXT'))
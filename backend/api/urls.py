@@ -3,6 +3,7 @@ from rest_framework.routers import DefaultRouter
 
 from api.views import (
     IngredientsViewSet,
+    MetricsView,
     TagsViewSet,
     RecipesViewSet
 )
@@ -14,6 +15,7 @@ router.register(r'tags', TagsViewSet, basename='tags')
 router.register(r'recipes', RecipesViewSet, basename='recipes')
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('api/recipes/download_shopping_cart/',
          RecipesViewSet.as_view({'get': 'download_shopping_cart'}),
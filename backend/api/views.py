@@ -1,18 +1,24 @@
-from django.http import HttpResponse
-from django.db.models import Sum
-from django.shortcuts import get_object_or_404
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.permissions import (
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly
 )
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from rest_framework.views import APIView
 
+from api.catalogue import ingredient_index, pantry_index, tag_catalogue
+from api.db import delete_links, insert_links
 from api.filters import (
     IngredientFilter,
     RecipeFilter
@@ -22,17 +28,28 @@ from api.serializers import (
     TagSerializer,
     RecipeListSerializer,
     RecipeCreateUpdateSerializer,
-    RecipeIngredient,
+    RecipeImageSerializer,
+    PantrySerializer,
+    PantryRecipeSerializer,
+    RecipeBatchSerializer,
     DownloadShoppingCartSerializer,
+    ShoppingCartIngredientSerializer,
     ShoppingListRecipeSerializer,
     FavoriteRecipeSerializer,
 )
-from api.paginations import Paginator
+from api.metrics import PrometheusRenderer, registry
+from api.paginations import PageNumberPaginator, Paginator
 from api.permissions import IsAuthorOrReadOnly
+from api.response_cache import recipe_response_cache
+from api.shopping_cart import (
+    get_exporter_classes,
+    get_shopping_cart_ingredients
+)
 from recipes.models import (
     Ingredient,
     Tag,
     Recipe,
+    ShoppingCartIngredient,
     ShoppingList,
     Favorite
 )
@@ -46,6 +63,15 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
 
+    @method_decorator(condition(
+        etag_func=ingredient_index.etag,
+        last_modified_func=ingredient_index.last_modified))
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return Response(ingredient_index.all())
+        return Response(ingredient_index.search(name))
+
 
 class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
@@ -53,16 +79,41 @@ class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
 
+    @method_decorator(condition(
+        etag_func=tag_catalogue.etag,
+        last_modified_func=tag_catalogue.last_modified))
+    def list(self, request, *args, **kwargs):
+        return Response(tag_catalogue.all())
+
 
 class RecipesViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly)
     pagination_class = Paginator
+    cursor_ordering = ('-publish_date', '-id')
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    shared_payload = False
+
+    def list(self, request, *args, **kwargs):
+        key = recipe_response_cache.get_list_key(request)
+        self.shared_payload = key is not None
+        return recipe_response_cache.serve(
+            key, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        key = recipe_response_cache.get_detail_key(request, kwargs['pk'])
+        self.shared_payload = key is not None
+        return recipe_response_cache.serve(
+            key, super().retrieve, request, *args, **kwargs)
+
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'pantry'):
+            queryset = queryset.for_list(
+                AnonymousUser() if self.shared_payload
+                else self.request.user)
         if self.request.user.is_authenticated:
             if self.request.query_params.get('is_favorited'):
                 queryset = queryset.filter(
@@ -82,22 +133,116 @@ class RecipesViewSet(viewsets.ModelViewSet):
 
     @staticmethod
     def add_to_list(model, serializer_class, user, pk, request):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
-            return Response({'errors': 'Рецепт уже в списке!'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
-        serializer = serializer_class(recipe, context={'request': request})
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        with transaction.atomic():
+            if not insert_links(model, user.id, [pk]):
+                if not Recipe.objects.filter(id=pk).exists():
+                    raise Http404
+                return Response({'errors': 'Рецепт уже в списке!'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            Recipe.objects.filter(id=pk).update(**{
+                model.counter_field: F(model.counter_field) + 1})
+            if model is ShoppingList:
+                ShoppingCartIngredient.objects.add_recipes([pk], [user.id])
+        serializer = serializer_class(
+            Recipe.objects.get(id=pk), context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
     def remove_from_list(model, user, pk):
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response({'errors': 'Рецепт уже удален из списка!'},
-                        status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=user, recipe_id=pk).delete()
+            if not deleted:
+                return Response({'errors': 'Рецепт уже удален из списка!'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            Recipe.objects.filter(**{
+                'id': pk, f'{model.counter_field}__gt': 0
+            }).update(**{
+                model.counter_field: F(model.counter_field) - 1})
+            if model is ShoppingList:
+                ShoppingCartIngredient.objects.remove_recipes(
+                    [pk], [user.id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def get_batch_ids(request):
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['recipes']))
+
+    @staticmethod
+    def add_many_to_list(model, user, recipe_ids):
+        with transaction.atomic():
+            added = insert_links(model, user.id, recipe_ids)
+            if added:
+                Recipe.objects.filter(id__in=added).update(**{
+                    model.counter_field: F(model.counter_field) + 1})
+                if model is ShoppingList:
+                    ShoppingCartIngredient.objects.add_recipes(
+                        added, [user.id])
+        skipped = [pk for pk in recipe_ids if pk not in added]
+        existing = set(Recipe.objects.filter(
+            id__in=skipped).values_list('id', flat=True)) if skipped else set()
+        return Response({'results': [
+            {'id': pk, 'status': (
+                'added' if pk in added
+                else 'already_added' if pk in existing else 'not_found')}
+            for pk in recipe_ids
+        ]})
+
+    @staticmethod
+    def remove_many_from_list(model, user, recipe_ids):
+        with transaction.atomic():
+            removed = delete_links(model, user.id, recipe_ids)
+            if removed:
+                Recipe.objects.filter(**{
+                    'id__in': removed, f'{model.counter_field}__gt': 0
+                }).update(**{
+                    model.counter_field: F(model.counter_field) - 1})
+                if model is ShoppingList:
+                    ShoppingCartIngredient.objects.remove_recipes(
+                        removed, [user.id])
+        return Response({'results': [
+            {'id': pk, 'status': (
+                'removed' if pk in removed else 'not_in_list')}
+            for pk in recipe_ids
+        ]})
+
+    @action(detail=True, methods=['put'],
+            permission_classes=(IsAuthenticated, IsAuthorOrReadOnly),
+            parser_classes=(MultiPartParser,))
+    def image(self, request, **kwargs):
+        serializer = RecipeImageSerializer(
+            self.get_object(), data=request.data,
+            context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            pagination_class=PageNumberPaginator)
+    def pantry(self, request):
+        serializer = PantrySerializer(data={
+            'ingredients': request.query_params.getlist('ingredients')})
+        serializer.is_valid(raise_exception=True)
+        page = self.paginate_queryset(pantry_index.match(
+            serializer.validated_data['ingredients']))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        results = []
+        for recipe_id, matched, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.matched_ingredients = matched
+            recipe.missing_ingredients = missing
+            results.append(recipe)
+        return self.get_paginated_response(PantryRecipeSerializer(
+            results, many=True, context=self.get_serializer_context()).data)
 
     @action(detail=True, methods=['post'],
             permission_classes=(IsAuthenticated,), pagination_class=None)
@@ -137,36 +282,58 @@ class RecipesViewSet(viewsets.ModelViewSet):
             kwargs['pk']
         )
 
-    @action(detail=False, methods=['get'],
+    @action(detail=False, methods=['post'], url_path='shopping_cart',
+            url_name='shopping-cart-batch',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return self.add_many_to_list(
+            ShoppingList, request.user, self.get_batch_ids(request))
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request):
+        return self.remove_many_from_list(
+            ShoppingList, request.user, self.get_batch_ids(request))
+
+    @action(detail=False, methods=['post'], url_path='favorite',
+            url_name='favorite-batch',
             permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        return self.add_many_to_list(
+            Favorite, request.user, self.get_batch_ids(request))
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request):
+        return self.remove_many_from_list(
+            Favorite, request.user, self.get_batch_ids(request))
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=get_exporter_classes())
     def download_shopping_cart(self, request, **kwargs):
-        shopping_cart = ShoppingList.objects.filter(user=request.user)
-        recipes = [item.recipe for item in shopping_cart]
-        ingredients = (
-            RecipeIngredient.objects.filter(recipe__in=recipes)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-        )
+        exporter = request.accepted_renderer
         serializer = DownloadShoppingCartSerializer(
-            data=ingredients, many=True)
-        serializer.is_valid()
-        response = HttpResponse(content_type='application/pdf')
-        response[
-            'Content-Disposition'] = 'attachment; filename="shopping_cart.pdf"'
-        font_path = '/app/FreeSans.ttf'
-        pdfmetrics.registerFont(TTFont('FreeSans', font_path))
-        p = canvas.Canvas(response)
-        p.setFont('FreeSans', 12)
-        p.drawString(100, 750, "Список покупок:")
-        y = 730
-        for ingredient in serializer.data:
-            y -= 15
-            text = "{} - {} {}".format(
-                ingredient['ingredient_name'],
-                ingredient['total_amount'],
-                ingredient['measurement_unit']
-            ).encode('utf-8')
-            p.drawString(100, y, text.decode('utf-8'))
-        p.showPage()
-        p.save()
+            get_shopping_cart_ingredients(request.user), many=True)
+        response = StreamingHttpResponse(
+            exporter.stream(serializer.data, request.user),
+            content_type=exporter.content_type)
+        response['Content-Disposition'] = (
+            'attachment; filename="{}"'.format(exporter.filename))
         return response
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,), pagination_class=None)
+    def shopping_cart_ingredients(self, request):
+        ingredients = ShoppingCartIngredient.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by(
+            'ingredient__name', 'ingredient__measurement_unit')
+        return Response(
+            ShoppingCartIngredientSerializer(ingredients, many=True).data)
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (JSONRenderer, PrometheusRenderer)
+
+    def get(self, request):
+        return Response(registry.snapshot())
@@ -17,9 +17,10 @@ class RecipeAdmin(admin.ModelAdmin):
         return obj.author.username
 
     def total_favorites(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     total_favorites.short_description = 'Total Favorites'
+    total_favorites.admin_order_field = 'favorites_count'
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -27,8 +28,24 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+class UserRecipeListAdmin(admin.ModelAdmin):
+    # Rows are added and removed through the API, which also updates the
+    # recipe counters and ShoppingCartIngredient; admin edits would not.
+    list_display = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Tag)
-admin.site.register(Favorite)
-admin.site.register(ShoppingList)
+admin.site.register(Favorite, UserRecipeListAdmin)
+admin.site.register(ShoppingList, UserRecipeListAdmin)
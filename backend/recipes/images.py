@@ -0,0 +1,107 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+from recipes.signals import recipe_changed
+
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_SIZE = getattr(settings, 'RECIPE_IMAGE_MAX_SIZE', (4096, 4096))
+IMAGE_VARIANTS = getattr(settings, 'RECIPE_IMAGE_VARIANTS', {
+    'list': (480, 480),
+    'detail': (1200, 1200),
+})
+IMAGE_WORKERS = getattr(settings, 'RECIPE_IMAGE_WORKERS', 2)
+VARIANTS_DIR = 'recipe/images/variants'
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_WORKERS, thread_name_prefix='recipe-images')
+
+
+def get_variant_name(image_name, variant, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{VARIANTS_DIR}/{stem}_{variant}.{extension}'
+
+
+def save_variant(storage, name, image, image_format, **options):
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def get_storage():
+    return Recipe._meta.get_field('image').storage
+
+
+def delete_variants(variants):
+    storage = get_storage()
+    for name in set(variants.values()):
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception('Не удалось удалить изображение %s', name)
+
+
+def reset_variants(recipe):
+    variants = recipe.image_variants
+    recipe.image_variants = {}
+    if variants:
+        transaction.on_commit(lambda: delete_variants(variants))
+
+
+def build_variants(recipe_id, image_name):
+    storage = get_storage()
+    with storage.open(image_name) as file, Image.open(file) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA') or (
+            image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    variants = {}
+    for variant, size in IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        if has_alpha:
+            variants[variant] = save_variant(
+                storage, get_variant_name(image_name, variant, 'png'),
+                resized, 'PNG', optimize=True)
+        else:
+            variants[variant] = save_variant(
+                storage, get_variant_name(image_name, variant, 'jpg'),
+                resized, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        variants[f'{variant}_webp'] = save_variant(
+            storage, get_variant_name(image_name, variant, 'webp'),
+            resized, 'WEBP', quality=WEBP_QUALITY)
+    if Recipe.objects.filter(id=recipe_id, image=image_name).update(
+            image_variants=variants):
+        recipe_changed.send(sender=Recipe, recipe_ids=[recipe_id])
+    else:
+        delete_variants(variants)
+    return variants
+
+
+def run_build_variants(recipe_id, image_name):
+    try:
+        return build_variants(recipe_id, image_name)
+    except Exception:
+        logger.exception(
+            'Не удалось подготовить изображения рецепта %s', recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe):
+    recipe_id, image_name = recipe.id, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(run_build_variants, recipe_id, image_name))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Build resized and WebP copies of recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересобрать копии для всех рецептов, а не только для новых')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        built = 0
+        for recipe_id, image_name in recipes.values_list('id', 'image'):
+            try:
+                build_variants(recipe_id, image_name)
+            except OSError as error:
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Подготовлены изображения для {built} рецептов.'))
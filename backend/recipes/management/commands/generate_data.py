@@ -0,0 +1,249 @@
+import base64
+import random
+import time
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCartIngredient,
+    ShoppingList,
+    Tag
+)
+from users.models import Subscription, User
+
+
+BATCH_SIZE = 5000
+PASSWORD = 'synthetic-password'
+IMAGE_NAME = 'recipe/images/synthetic.png'
+IMAGE = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwAD'
+    'hgGAWjR9awAAAABJRU5ErkJggg=='
+)
+WORDS = (
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Каша', 'Омлет', 'Паста', 'Плов',
+    'домашний', 'быстрый', 'острый', 'летний', 'сытный', 'овощной',
+    'с грибами', 'с курицей', 'с сыром', 'по-деревенски',
+)
+
+
+def power_law_weights(count, exponent):
+    return list(accumulate(
+        1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic users, recipes, favorites, carts and '
+        'subscriptions with power-law popularity for load testing'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10,
+                            help='Минимальное количество тегов в базе')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--subscriptions', type=int, default=10000)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель степенного распределения')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        counts = (
+            'users', 'recipes', 'tags', 'ingredients_per_recipe',
+            'tags_per_recipe', 'favorites', 'carts', 'subscriptions')
+        if any(options[name] < 0 for name in counts):
+            raise CommandError('Количества не могут быть отрицательными')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if options['recipes'] and not ingredient_ids:
+            raise CommandError(
+                'Нет ингредиентов: сначала выполните load_ingredients')
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        self.prefix = 'synthetic{:x}'.format(int(time.time()))
+        started = time.monotonic()
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'])
+            tag_ids = self.create_tags(options['tags'])
+            recipe_ids = self.create_recipes(
+                options['recipes'], user_ids, tag_ids, ingredient_ids,
+                options['ingredients_per_recipe'],
+                options['tags_per_recipe'])
+            self.create_links(
+                Favorite, options['favorites'], user_ids, recipe_ids)
+            self.create_links(
+                ShoppingList, options['carts'], user_ids, recipe_ids)
+            self.create_subscriptions(options['subscriptions'], user_ids)
+            if recipe_ids:
+                self.analyze(
+                    Recipe, RecipeIngredient, Favorite, ShoppingList)
+                recipes = Recipe.objects.filter(id__gte=min(recipe_ids))
+                recipes.recount()
+                recipes.update_search_vector()
+            if recipe_ids and user_ids:
+                ShoppingCartIngredient.objects.rebuild(
+                    users=User.objects.filter(id__gte=min(user_ids)),
+                    batch_size=self.batch_size)
+        self.save_image()
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.monotonic() - started:.1f} с. '
+            f'Пароль пользователей {self.prefix}_*: {PASSWORD}'))
+
+    @staticmethod
+    def analyze(*models):
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE {}'.format(', '.join(
+                connection.ops.quote_name(model._meta.db_table)
+                for model in models)))
+
+    def pick(self, population, weights, count):
+        return self.random.choices(population, cum_weights=weights, k=count)
+
+    def bulk_create(self, model, objects, **kwargs):
+        created = 0
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch, **kwargs)
+            created += len(batch)
+        self.stdout.write(f'{model._meta.db_table}: {created}')
+
+    @staticmethod
+    def get_last_id(model):
+        return model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+    def create_users(self, count):
+        last_id = self.get_last_id(User)
+        password = make_password(PASSWORD)
+        self.bulk_create(User, (
+            User(
+                email=f'{self.prefix}_{index}@example.com',
+                username=f'{self.prefix}_{index}',
+                first_name='Пользователь',
+                last_name=str(index),
+                password=password,
+            )
+            for index in range(count)
+        ))
+        user_ids = list(User.objects.filter(
+            id__gt=last_id).values_list('id', flat=True))
+        self.random.shuffle(user_ids)
+        return user_ids
+
+    def create_tags(self, count):
+        missing = count - Tag.objects.count()
+        if missing > 0:
+            colors = set(Tag.objects.values_list('color', flat=True))
+            tags = []
+            for index in range(missing):
+                color = None
+                while color is None or color in colors:
+                    color = '#{:06X}'.format(self.random.getrandbits(24))
+                colors.add(color)
+                tags.append(Tag(
+                    name=f'Тег {self.prefix} {index}',
+                    color=color,
+                    slug=f'{self.prefix}-{index}',
+                ))
+            self.bulk_create(Tag, tags)
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_recipes(self, count, user_ids, tag_ids, ingredient_ids,
+                       ingredients_per_recipe, tags_per_recipe):
+        if not count or not user_ids:
+            return []
+        last_id = self.get_last_id(Recipe)
+        authors = self.pick(
+            user_ids, power_law_weights(len(user_ids), self.skew), count)
+        self.bulk_create(Recipe, (
+            Recipe(
+                author_id=author_id,
+                name=' '.join(self.random.sample(WORDS, 3)),
+                text=' '.join(self.random.choices(WORDS, k=30)),
+                cooking_time=self.random.randint(5, 180),
+                image=IMAGE_NAME,
+            )
+            for author_id in authors
+        ))
+        recipe_ids = list(Recipe.objects.filter(
+            id__gt=last_id).values_list('id', flat=True))
+        ingredient_ids = self.random.sample(
+            ingredient_ids, len(ingredient_ids))
+        ingredient_weights = power_law_weights(
+            len(ingredient_ids), self.skew)
+        self.bulk_create(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in set(self.pick(
+                ingredient_ids, ingredient_weights,
+                max(1, ingredients_per_recipe)))
+        ))
+        tag_weights = power_law_weights(len(tag_ids), self.skew)
+        through = Recipe.tags.through
+        self.bulk_create(through, (
+            through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in set(self.pick(
+                tag_ids, tag_weights, max(1, tags_per_recipe)))
+        ) if tag_ids else ())
+        self.random.shuffle(recipe_ids)
+        return recipe_ids
+
+    def create_links(self, model, count, user_ids, recipe_ids):
+        if not count or not user_ids or not recipe_ids:
+            return
+        users = self.pick(
+            user_ids, power_law_weights(len(user_ids), self.skew), count)
+        recipes = self.pick(
+            recipe_ids, power_law_weights(len(recipe_ids), self.skew), count)
+        self.bulk_create(model, (
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id, recipe_id in set(zip(users, recipes))
+        ), ignore_conflicts=True)
+
+    def create_subscriptions(self, count, user_ids):
+        if not count or len(user_ids) < 2:
+            return
+        weights = power_law_weights(len(user_ids), self.skew)
+        followers = self.random.choices(user_ids, k=count)
+        authors = self.pick(user_ids, weights, count)
+        self.bulk_create(Subscription, (
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id, author_id in set(zip(followers, authors))
+            if user_id != author_id
+        ), ignore_conflicts=True)
+
+    @staticmethod
+    def save_image():
+        storage = Recipe._meta.get_field('image').storage
+        if not storage.exists(IMAGE_NAME):
+            storage.save(IMAGE_NAME, ContentFile(IMAGE))
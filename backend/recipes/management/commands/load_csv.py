@@ -1,22 +1,7 @@
-import os
-import csv
-from django.core.management.base import BaseCommand
-from django.conf import settings
-from recipes.models import Ingredient
+from recipes.management.commands.load_ingredients import (
+    Command as LoadIngredientsCommand
+)
 
 
-class Command(BaseCommand):
-    help = 'Load data from CSV file'
-
-    def handle(self, *args, **options):
-        csv_file_path = os.path.join(
-            settings.BASE_DIR, 'fixtures', 'ingredients.csv')
-
-        with open(csv_file_path, 'r', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                name, measurement_unit = row
-                Ingredient.objects.create(
-                    name=name, measurement_unit=measurement_unit)
-
-        self.stdout.write(self.style.SUCCESS("Data loaded successfully."))
+class Command(LoadIngredientsCommand):
+    help = 'Load ingredients from CSV file (alias of load_ingredients)'
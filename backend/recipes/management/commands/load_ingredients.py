@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Ingredient
+
+
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, 'fixtures', 'ingredients.csv')
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+FORMATS = ('csv', 'json')
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if len(row) != 2:
+            raise CommandError(f'Некорректная строка CSV: {row}')
+        yield row
+
+
+def iter_json(file):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        buffer = buffer.lstrip()
+        if started:
+            buffer = buffer.lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        if buffer:
+            if not started:
+                if not buffer.startswith('['):
+                    raise CommandError('Ожидается JSON-массив ингредиентов')
+                buffer = buffer[1:]
+                started = True
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                item = None
+            if item is not None:
+                buffer = buffer[end:]
+                yield item['name'], item['measurement_unit']
+                continue
+        chunk = file.read(READ_SIZE)
+        if not chunk:
+            raise CommandError('Неожиданный конец JSON-файла')
+        buffer += chunk
+
+
+class Command(BaseCommand):
+    help = 'Load ingredients from CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=DEFAULT_PATH,
+            help='Путь к файлу с ингредиентами (CSV или JSON)')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла; по умолчанию определяется по расширению')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество строк в одном INSERT')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        parse = iter_csv if file_format == 'csv' else iter_json
+        existing = Ingredient.objects.count()
+        processed = 0
+        started = time.monotonic()
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                rows = parse(file)
+                while True:
+                    batch = [
+                        Ingredient(
+                            name=name.strip(),
+                            measurement_unit=measurement_unit.strip()
+                        )
+                        for name, measurement_unit in islice(rows, batch_size)
+                    ]
+                    if not batch:
+                        break
+                    Ingredient.objects.bulk_create(
+                        batch, ignore_conflicts=True)
+                    processed += len(batch)
+                    if options['verbosity'] > 1:
+                        self.stdout.write('{} строк, {:.0f} строк/с'.format(
+                            processed, self.rate(processed, started)))
+        except OSError as error:
+            raise CommandError(error)
+        created = Ingredient.objects.count() - existing
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {processed} строк, добавлено {created} за '
+            f'{time.monotonic() - started:.2f} с '
+            f'({self.rate(processed, started):.0f} строк/с).'))
+
+    @staticmethod
+    def rate(processed, started):
+        return processed / max(time.monotonic() - started, 1e-6)
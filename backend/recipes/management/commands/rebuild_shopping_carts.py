@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Rebuild aggregated shopping cart ingredients of users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', nargs='+', type=int, metavar='ID',
+            help='Rebuild only the carts of the given users')
+
+    def handle(self, *args, **options):
+        created = ShoppingCartIngredient.objects.rebuild(
+            users=options['users'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Список покупок пересобран: {created} ингредиентов.'))
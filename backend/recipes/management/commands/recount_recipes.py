@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Rebuild favorites and shopping cart counters of recipes'
+
+    def handle(self, *args, **options):
+        updated = Recipe.objects.recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны для {updated} рецептов.'))
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:43
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def recount(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingList = apps.get_model('recipes', 'ShoppingList')
+    Recipe.objects.update(**{
+        counter_field: Coalesce(Subquery(
+            model.objects.filter(recipe=OuterRef('pk'))
+            .values('recipe')
+            .annotate(total=Count('id'))
+            .values('total')
+        ), 0)
+        for model, counter_field in (
+            (Favorite, 'favorites_count'),
+            (ShoppingList, 'shopping_cart_count'),
+        )
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_sync_models_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-publish_date'], name='recipe_popular_idx'),
+        ),
+        migrations.RunPython(recount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:50
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, TextField
+
+
+SEARCH_INDEX = 'recipe_search_idx'
+SEARCH_CONFIG = getattr(settings, 'RECIPE_SEARCH_CONFIG', 'russian')
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    schema_editor.execute('CREATE INDEX {} ON {} USING gin ({})'.format(
+        schema_editor.quote_name(SEARCH_INDEX),
+        schema_editor.quote_name(Recipe._meta.db_table),
+        schema_editor.quote_name('search_vector'),
+    ))
+    ingredient_names = Subquery(
+        RecipeIngredient.objects.filter(recipe=OuterRef('pk'))
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names'),
+        output_field=TextField()
+    )
+    Recipe.objects.update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    ))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS {}'.format(
+        schema_editor.quote_name(SEARCH_INDEX)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
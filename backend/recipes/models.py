@@ -1,13 +1,37 @@
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField
+)
+from django.db import connections, models
+from django.db.models import (
+    BooleanField,
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    TextField,
+    UniqueConstraint,
+    Value,
+    Window
+)
+from django.db.models.functions import Coalesce, RowNumber
 from django.core.validators import MinValueValidator
 
 from colorfield.fields import ColorField
 
-from users.models import User
+from users.models import User, Subscription
 
 
 MAX_LENGTH = 200
+SEARCH_CONFIG = getattr(settings, 'RECIPE_SEARCH_CONFIG', 'russian')
 
 
 class Tag(models.Model):
@@ -54,11 +78,108 @@ class Ingredient(models.Model):
                 fields=['name', 'measurement_unit'],
                 name='unique_ingredient')
         ]
+        indexes = [
+            models.Index(
+                fields=['name'],
+                name='ingredient_name_prefix_idx',
+                opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false,
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author'))),
+        )
+
+    def recount(self):
+        return self.update(**{
+            counter_field: Coalesce(Subquery(
+                model.objects.filter(recipe=OuterRef('pk'))
+                .values('recipe')
+                .annotate(total=Count('id'))
+                .values('total')
+            ), 0)
+            for model, counter_field in (
+                (Favorite, Favorite.counter_field),
+                (ShoppingList, ShoppingList.counter_field),
+            )
+        })
+
+    def latest_per_author(self, limit):
+        ranked = self.annotate(rank_in_author=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=F('publish_date').desc(),
+        ))
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.raw(
+            'SELECT * FROM ({}) ranked WHERE rank_in_author <= %s '
+            'ORDER BY author_id, rank_in_author'.format(sql),
+            (*params, limit)
+        )
+
+    def supports_search_vector(self):
+        return connections[self.db].vendor == 'postgresql'
+
+    def update_search_vector(self):
+        if not self.supports_search_vector():
+            return 0
+        ingredient_names = Subquery(
+            RecipeIngredient.objects.filter(recipe=OuterRef('pk'))
+            .values('recipe')
+            .annotate(names=StringAgg('ingredient__name', ' '))
+            .values('names'),
+            output_field=TextField()
+        )
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        ))
+
+    def search(self, query):
+        if self.supports_search_vector():
+            search_query = SearchQuery(
+                query, config=SEARCH_CONFIG, search_type='websearch')
+            return self.filter(search_vector=search_query).annotate(
+                search_rank=SearchRank(F('search_vector'), search_query)
+            ).order_by('-search_rank', '-publish_date', '-id')
+        return self.filter(
+            Q(name__icontains=query)
+            | Q(text__icontains=query)
+            | Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=query))
+        )
+
+    def for_list(self, user):
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('id')),
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')
+            ),
+        ).with_user_flags(user)
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -74,6 +195,12 @@ class Recipe(models.Model):
         'Картинка',
         upload_to='recipe/images'
     )
+    image_variants = models.JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     text = models.TextField('Текстовое описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -92,11 +219,39 @@ class Recipe(models.Model):
             1, message='Время приготовления должно быть больше 0')]
     )
     publish_date = models.DateTimeField(auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'Добавлений в список покупок',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-publish_date']
+        indexes = [
+            models.Index(
+                fields=['-favorites_count', '-publish_date'],
+                name='recipe_popular_idx'),
+            models.Index(
+                fields=['-publish_date', '-id'],
+                name='recipe_cursor_idx'),
+            models.Index(
+                fields=['author', '-publish_date', '-id'],
+                name='recipe_author_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -152,7 +307,7 @@ class FavoriteShoppingList(models.Model):
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'],
-                name='unique_list_item'
+                name='unique_%(class)s'
             )
         ]
 
@@ -161,12 +316,102 @@ class FavoriteShoppingList(models.Model):
 
 
 class Favorite(FavoriteShoppingList):
-    class Meta:
+    counter_field = 'favorites_count'
+
+    class Meta(FavoriteShoppingList.Meta):
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранное'
 
 
 class ShoppingList(FavoriteShoppingList):
-    class Meta:
+    counter_field = 'shopping_cart_count'
+
+    class Meta(FavoriteShoppingList.Meta):
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
+
+
+class ShoppingCartIngredientQuerySet(models.QuerySet):
+    def shift(self, recipe_ids, sign, **filters):
+        amounts = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids,
+            ingredient_id=OuterRef('ingredient_id')
+        ).order_by().values('ingredient_id')
+        return self.filter(Exists(amounts), **filters).update(
+            total_amount=F('total_amount') + sign * Subquery(
+                amounts.annotate(total=Sum('amount')).values('total')),
+            recipe_count=F('recipe_count') + sign * Subquery(
+                amounts.annotate(count=Count('id')).values('count')),
+        )
+
+    def add_recipes(self, recipe_ids, user_ids):
+        ingredient_ids = set(RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).values_list('ingredient_id', flat=True))
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id in ingredient_ids
+            ],
+            ignore_conflicts=True
+        )
+        return self.shift(recipe_ids, 1, user_id__in=user_ids)
+
+    def remove_recipes(self, recipe_ids, user_ids):
+        updated = self.shift(recipe_ids, -1, user_id__in=user_ids)
+        self.filter(user_id__in=user_ids, recipe_count__lte=0).delete()
+        return updated
+
+    def rebuild(self, users=None, batch_size=1000):
+        rows = RecipeIngredient.objects.filter(
+            recipe__shoppinglist__isnull=False)
+        if users is None:
+            self.all().delete()
+        else:
+            self.filter(user__in=users).delete()
+            rows = rows.filter(recipe__shoppinglist__user__in=users)
+        rows = rows.values(
+            'ingredient_id', user_id=F('recipe__shoppinglist__user')
+        ).annotate(
+            total_amount=Sum('amount'),
+            recipe_count=Count('id'),
+        ).order_by()
+        created = 0
+        batch = []
+        for row in rows.iterator():
+            batch.append(self.model(**row))
+            if len(batch) >= batch_size:
+                created += len(self.bulk_create(batch))
+                batch = []
+        return created + len(self.bulk_create(batch))
+
+
+class ShoppingCartIngredient(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_cart_ingredients'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_cart_ingredients'
+    )
+    total_amount = models.IntegerField('Общее количество', default=0)
+    recipe_count = models.IntegerField('Количество рецептов', default=0)
+
+    objects = ShoppingCartIngredientQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списка покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_ingredient')
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} - {self.ingredient.name}'
@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+
+# Отправляется при изменениях рецептов, которые не проходят через
+# Model.save(): bulk-операции и update() в фоновых задачах.
+# Аргумент: recipe_ids — идентификаторы измененных рецептов.
+recipe_changed = Signal()
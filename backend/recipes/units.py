@@ -0,0 +1,122 @@
+import re
+from collections import namedtuple
+
+from django.conf import settings
+
+
+MASS = 'mass'
+VOLUME = 'volume'
+AMOUNT_PRECISION = 2
+
+Unit = namedtuple('Unit', ('dimension', 'factor'))
+
+UNITS = {
+    'мг': Unit(MASS, 0.001),
+    'г': Unit(MASS, 1),
+    'гр': Unit(MASS, 1),
+    'кг': Unit(MASS, 1000),
+    'мл': Unit(VOLUME, 1),
+    'л': Unit(VOLUME, 1000),
+    'капля': Unit(VOLUME, 0.05),
+    'ч. л.': Unit(VOLUME, 5),
+    'дес. л.': Unit(VOLUME, 10),
+    'ст. л.': Unit(VOLUME, 15),
+    'стакан': Unit(VOLUME, 250),
+}
+DISPLAY_UNITS = {
+    MASS: (('кг', 1000), ('г', 1)),
+    VOLUME: (('л', 1000), ('мл', 1)),
+}
+DENSITIES = {
+    'вода': 1.0,
+    'молоко': 1.03,
+    'кефир': 1.03,
+    'сливки': 1.0,
+    'сметана': 1.0,
+    'сок': 1.05,
+    'вино': 0.99,
+    'уксус': 1.01,
+    'соус': 1.1,
+    'сироп': 1.3,
+    'мед': 1.42,
+    'масло': 0.92,
+    'мука': 0.53,
+    'сахар': 0.85,
+    'сахарная пудра': 0.56,
+    'соль': 1.2,
+    'сода': 0.9,
+    'разрыхлитель': 0.9,
+    'пекарский порошок': 0.9,
+    'крахмал': 0.65,
+    'какао': 0.5,
+    'рис': 0.8,
+    'манка': 0.7,
+}
+
+
+class UnitRegistry:
+    def __init__(self, units, densities, display_units):
+        self.units = {
+            self.get_key(name): unit for name, unit in units.items()}
+        self.densities = {
+            name.casefold(): density for name, density in densities.items()}
+        self.display_units = display_units
+        self.resolved = {}
+
+    @staticmethod
+    def get_key(unit):
+        return re.sub(r'[\s.]+', '', unit.casefold())
+
+    def get_unit(self, name):
+        if name not in self.resolved:
+            self.resolved[name] = self.units.get(self.get_key(name))
+        return self.resolved[name]
+
+    def get_density(self, ingredient):
+        ingredient = ingredient.casefold()
+        if ingredient in self.densities:
+            return self.densities[ingredient]
+        for word in re.findall(r'[\w-]+', ingredient):
+            if word in self.densities:
+                return self.densities[word]
+        return None
+
+    def get_base(self, measurement_unit, amount):
+        unit = self.get_unit(measurement_unit)
+        if unit is None:
+            return measurement_unit, amount
+        return unit.dimension, amount * unit.factor
+
+    def get_display(self, dimension, amount):
+        if dimension not in self.display_units:
+            return dimension, amount
+        for name, factor in self.display_units[dimension]:
+            if amount >= factor:
+                break
+        amount = round(amount / factor, AMOUNT_PRECISION)
+        return name, int(amount) if amount == int(amount) else amount
+
+    def consolidate(self, rows):
+        totals = {}
+        for ingredient, measurement_unit, amount in rows:
+            dimension, amount = self.get_base(measurement_unit, amount)
+            key = (ingredient, dimension)
+            totals[key] = totals.get(key, 0) + amount
+        for ingredient, dimension in list(totals):
+            if dimension != VOLUME or (ingredient, MASS) not in totals:
+                continue
+            density = self.get_density(ingredient)
+            if density is not None:
+                totals[ingredient, MASS] += (
+                    totals.pop((ingredient, VOLUME)) * density)
+        return [
+            (ingredient, *self.get_display(dimension, amount))
+            for (ingredient, dimension), amount in totals.items()
+        ]
+
+
+unit_registry = UnitRegistry(
+    {**UNITS, **getattr(settings, 'MEASUREMENT_UNITS', {})},
+    {**DENSITIES, **getattr(settings, 'INGREDIENT_DENSITIES', {})},
+    DISPLAY_UNITS,
+)
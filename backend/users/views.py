@@ -1,18 +1,22 @@
+from collections import defaultdict
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth import update_session_auth_hash
-from django.shortcuts import get_object_or_404
+from django.db.models import Count, Exists, OuterRef
+from django.http import Http404
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
+from api.db import insert_links
 from api.paginations import Paginator
 from api.serializers import (
     UserSerializer,
     UserCreateSerializer,
     SetPasswordSerializer,
-    SubscriptionSerializer,
-    SubscriptionActionSerializer
+    SubscriptionSerializer
 )
+from recipes.models import Recipe
 from users.models import User, Subscription
 
 
@@ -21,6 +25,7 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
     pagination_class = Paginator
+    cursor_ordering = ('id',)
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -64,22 +69,52 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,),
             pagination_class=Paginator)
     def subscriptions(self, request):
-        queryset = User.objects.filter(subscription_author__user=request.user)
-        page = self.paginate_queryset(queryset)
+        page = self.paginate_queryset(self.get_subscriptions(request.user))
+        self.attach_recipes(page, request.query_params.get('recipes_limit'))
         serializer = SubscriptionSerializer(page, many=True,
                                             context={'request': request})
         return self.get_paginated_response(serializer.data)
 
+    @staticmethod
+    def get_subscriptions(user):
+        return User.objects.filter(
+            subscription_author__user=user
+        ).annotate(
+            recipes_count=Count('recipes'),
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('pk'))),
+        ).order_by('id')
+
+    @staticmethod
+    def attach_recipes(authors, recipes_limit):
+        recipes = Recipe.objects.filter(author__in=authors)
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.latest_per_author(int(recipes_limit))
+        recipes_by_author = defaultdict(list)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.limited_recipes = recipes_by_author[author.id]
+
+    @staticmethod
+    def get_author_id(pk):
+        try:
+            return int(pk)
+        except ValueError:
+            raise Http404
+
     @action(detail=True, methods=['post'],
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=kwargs['pk'])
-        serializer = SubscriptionActionSerializer(
-            data={'author': author}, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        subscription, created = Subscription.objects.get_or_create(
-            user=request.user, author=author)
-        if not created:
+        author_id = self.get_author_id(kwargs['pk'])
+        if author_id == request.user.id:
+            return Response(
+                {'errors': 'Вы не можете подписаться на себя.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        if not insert_links(
+                Subscription, request.user.id, [author_id], 'author'):
+            if not User.objects.filter(id=author_id).exists():
+                raise Http404
             return Response(
                 {'error': 'Вы уже подписаны на этого пользователя',
                  'is_subscribed': True},
@@ -91,16 +126,13 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @subscribe.mapping.delete
     def delete_subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=kwargs['pk'])
-        subscription = Subscription.objects.filter(
-            user=request.user, author=author).first()
-        if not subscription:
+        author_id = self.get_author_id(kwargs['pk'])
+        deleted, _ = Subscription.objects.filter(
+            user=request.user, author_id=author_id).delete()
+        if not deleted:
+            if not User.objects.filter(id=author_id).exists():
+                raise Http404
             return Response({'errors': 'Подписка не существует',
                              'is_subscribed': False},
                             status=status.HTTP_400_BAD_REQUEST)
-        subscription.delete()
-        serializer = SubscriptionActionSerializer(
-            author, context={'request': request})
-        data = serializer.data
-        data['is_subscribed'] = False
-        return Response(data, status=status.HTTP_204_NO_CONTENT)
+        return Response(status=status.HTTP_204_NO_CONTENT)